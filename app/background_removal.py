@@ -0,0 +1,189 @@
+import io
+import os
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from PIL import Image
+
+from app.database import db, User, ImageModel
+from app.derivatives import make_all_derivatives
+from app.storage import storage, atomic_write, STAGING_SUFFIX
+from app.metrics import STAGE_SECONDS
+
+# Set once per pool process by _init_worker, so the U2Net model is loaded once and reused
+_session = None
+
+
+def _init_worker(model_name):
+    global _session
+    if model_name is None:
+        return
+    try:
+        from rembg import new_session
+        _session = new_session(model_name)
+    except Exception as e:
+        # An initializer that raises breaks the whole pool; retry per image instead
+        print(f"❌ Could not load rembg model {model_name}: {e}")
+
+
+def remove_background(src_path, upload_folder, filename, model_name="u2net"):
+    """
+    Runs in a pool process: cut out the garment, flatten it on white and write a JPEG.
+    - filename: ImageModel.image_path, relative to upload_folder
+    - model_name: rembg model, None to skip the cut-out (BACKGROUND_REMOVAL=none)
+    Returns {stage: seconds}; metrics live in the parent process, which records them.
+    """
+    global _session
+    timings = {}
+
+    start = time.perf_counter()
+    with open(src_path, "rb") as f:
+        image_bytes = f.read()
+    input_image = Image.open(io.BytesIO(image_bytes)).convert("RGBA")
+    timings["image_decode"] = time.perf_counter() - start
+
+    if model_name is None:
+        output_image = input_image
+    else:
+        from rembg import new_session, remove
+
+        start = time.perf_counter()
+        if _session is None:
+            _session = new_session(model_name)
+        output_image = remove(input_image, session=_session)
+        timings["rembg"] = time.perf_counter() - start
+
+    white_bg = Image.new("RGB", output_image.size, (255, 255, 255))
+    white_bg.paste(output_image, mask=output_image.split()[3])
+
+    # Write-then-rename so a half-written JPEG is never served, and check the written file
+    # once here so the /uploads route can serve it without re-reading it
+    def write(tmp_path):
+        white_bg.save(tmp_path, format="JPEG")
+        with Image.open(tmp_path) as written:
+            written.verify()
+
+    atomic_write(os.path.join(upload_folder, *filename.split("/")), write)
+    make_all_derivatives(upload_folder, filename)
+    return timings
+
+
+class BackgroundRemovalPipeline:
+    """
+    Removes backgrounds of uploaded images outside the request, on a process pool.
+    - Raw uploads wait in <UPLOAD_FOLDER>/incoming (named after the image id) until processed
+    - ImageModel.status goes processing -> ready (or failed), the client polls /upload-status
+    - Every finished image is handed to the recommendation scheduler as an incremental update
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._executor = None
+        self._in_flight = 0
+        self._in_flight_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.workers = app.config.get("BACKGROUND_REMOVAL_WORKERS", 2)
+        # "none" keeps uploads as they are (offline runs, benchmarks), images still go through the pool
+        enabled = app.config.get("BACKGROUND_REMOVAL", "rembg") != "none"
+        self.model_name = app.config.get("REMBG_MODEL", "u2net") if enabled else None
+        self.upload_folder = os.path.abspath(app.config["UPLOAD_FOLDER"])
+        self.incoming_folder = os.path.join(self.upload_folder, "incoming")
+        os.makedirs(self.incoming_folder, exist_ok=True)
+
+    def _pool(self):
+        if self._executor is None:
+            # spawn, not fork: the parent already runs torch threads
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.model_name,),
+            )
+        return self._executor
+
+    def staging_path(self, image_id):
+        return os.path.join(self.incoming_folder, f"{image_id}{STAGING_SUFFIX}")
+
+    def submit(self, image_id, filename):
+        """Queues the staged raw upload of image_id, to be written to filename; its ImageModel is updated when done."""
+        args = (self.staging_path(image_id), self.upload_folder, filename, self.model_name)
+        submitted = time.perf_counter()
+        try:
+            future = self._pool().submit(remove_background, *args)
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM); start a fresh pool
+            self._executor = None
+            future = self._pool().submit(remove_background, *args)
+        with self._in_flight_lock:
+            self._in_flight += 1
+        future.add_done_callback(lambda f: self._finish(image_id, filename, f, submitted))
+        return future
+
+    def in_flight(self):
+        """Images submitted to the pool and not finished yet (queued or being processed)."""
+        return self._in_flight
+
+    def resume(self):
+        """Re-submits images that were still processing when the server stopped."""
+        with self.app.app_context():
+            pending = ImageModel.query.filter_by(status="processing").all()
+            for img in pending:
+                if os.path.exists(self.staging_path(img.id)):
+                    self.submit(img.id, img.image_path)
+                else:
+                    img.status = "failed"
+                    img.error = "Upload was interrupted, please upload the image again."
+            db.session.commit()
+            if pending:
+                print(f"♻️ Resumed background removal for {len(pending)} images")
+
+    def _finish(self, image_id, filename, future, submitted):
+        from app.jobs import scheduler  # not at module level: pool processes import this module and must stay light
+
+        with self._in_flight_lock:
+            self._in_flight -= 1
+        # Queue wait included: this is how long the client waits for the image to become ready
+        STAGE_SECONDS.observe(time.perf_counter() - submitted, stage="background_removal")
+        if not future.cancelled() and future.exception() is None:
+            for stage, seconds in future.result().items():
+                STAGE_SECONDS.observe(seconds, stage=stage)
+
+        try:
+            with self.app.app_context():
+                img = db.session.get(ImageModel, image_id)
+                error = future.exception()
+                if img is None or img.image_path != filename:
+                    # Deleted while processing, the file may be shared with another upload of the same bytes
+                    storage.remove([filename])
+                elif error is not None:
+                    print(f"❌ Background removal failed for {filename}: {error}")
+                    img.status = "failed"
+                    img.error = str(error)
+                    User.bump_cache_version(img.user_id)
+                    db.session.commit()
+                else:
+                    img.status = "ready"
+                    User.bump_cache_version(img.user_id)
+                    db.session.commit()
+                    scheduler.enqueue(img.user_id, new_image_paths=[filename])
+        except Exception as e:
+            print(f"❌ Could not record background removal result for {filename}: {e}")
+        finally:
+            self._discard(self.staging_path(image_id))
+
+    @staticmethod
+    def _discard(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+pipeline = BackgroundRemovalPipeline()
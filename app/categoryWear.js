@@ -5,6 +5,7 @@ import {
 } from 'react-native';
 import { useRouter, useLocalSearchParams } from 'expo-router';
 import Icon from 'react-native-vector-icons/Ionicons';
+import AsyncStorage from '@react-native-async-storage/async-storage';
 
 const API_URL = "http://192.168.1.8:5000"; // Flask Server IP
 
@@ -25,7 +26,8 @@ export default function CategoryWear() {
   const fetchImages = async () => {
     try {
       setLoading(true);
-      const response = await fetch(`${TECH_API_URL}/images/${category}`);
+      const userId = await AsyncStorage.getItem('user_id');
+      const response = await fetch(`${TECH_API_URL}/images/${category}?user_id=${userId}`);
       const data = await response.json();
 
       console.log(`Fetched Images for ${category}:`, data);
@@ -1,4 +1,6 @@
+from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import text
 
 db = SQLAlchemy()
 
@@ -6,12 +8,36 @@ class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(50), unique=True, nullable=False)
     password = db.Column(db.String(255), nullable=False)
+    # Bumped on every change to the user's wardrobe, saved outfits or recommendations;
+    # the read endpoints derive their ETags and response cache keys from it
+    cache_version = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+
+    @staticmethod
+    def bump_cache_version(user_id):
+        """Invalidates the user's cached responses, as part of the caller's transaction (commit pending)."""
+        db.session.execute(
+            db.update(User).where(User.id == int(user_id)).values(cache_version=User.cache_version + 1)
+        )
 
 class ImageModel(db.Model):
     id = db.Column(db.String(50), primary_key=True)
     image_path = db.Column(db.String(255), nullable=False)
     category = db.Column(db.String(50), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default="ready")  # processing, ready, failed
+    error = db.Column(db.Text, nullable=True)
+    content_hash = db.Column(db.String(64), nullable=True)  # SHA-256 of the uploaded bytes
+    phash = db.Column(db.String(16), nullable=True)  # dHash of the uploaded image, see image_hashes
+
+    __table_args__ = (
+        db.Index("ix_image_model_user_category", "user_id", "category"),
+        db.Index("ix_image_model_category", "category"),
+        db.Index("ix_image_model_user_path", "user_id", "image_path"),
+        # Keyset pagination of wardrobe listings walks these in id order
+        db.Index("ix_image_model_user_id_key", "user_id", "id"),
+        db.Index("ix_image_model_user_category_id", "user_id", "category", "id"),
+        db.Index("ix_image_model_user_content_hash", "user_id", "content_hash"),
+    )
 
 class RecommendationResult(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -22,6 +48,52 @@ class RecommendationResult(db.Model):
     match_score = db.Column(db.Float, nullable=False)
     heatmap_paths = db.Column(db.Text, nullable=False)
 
+    __table_args__ = (
+        # event is always "N/A" (per-event ranking is in recommendation_score), so only user_id is indexed
+        db.Index("ix_recommendation_result_user", "user_id"),
+    )
+
+class RecommendationScore(db.Model):
+    # One row per (recommendation, event) so /recommend can filter and sort in SQL
+    result_id = db.Column(db.Integer, db.ForeignKey("recommendation_result.id"), primary_key=True)
+    event = db.Column(db.String(50), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    score = db.Column(db.Float, nullable=False)
+
+    __table_args__ = (
+        db.Index("ix_recommendation_score_user_event_score", "user_id", "event", "score"),
+        {"sqlite_with_rowid": False},  # the primary key is the storage order, no extra rowid b-tree
+    )
+
+class RecommendationJob(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default="pending")  # pending, running, done, failed
+    full_rebuild = db.Column(db.Boolean, nullable=False, default=False)
+    new_image_paths = db.Column(db.Text, nullable=False, default="[]")  # JSON list, used when not a full rebuild
+    progress = db.Column(db.Float, nullable=False, default=0.0)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index("ix_recommendation_job_user_status", "user_id", "status"),
+        # At most one pending job per user, also across processes: enqueue merges into it
+        db.Index("ux_recommendation_job_user_pending", "user_id", unique=True,
+                 sqlite_where=text("status = 'pending'")),
+    )
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'full_rebuild': self.full_rebuild,
+            'progress': round(self.progress, 4),
+            'error': self.error,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat()
+        }
+
 class Saved(db.Model):
     __tablename__ = 'saved'
     id = db.Column(db.Integer, primary_key=True)
@@ -29,6 +101,24 @@ class Saved(db.Model):
     event = db.Column(db.String(100), nullable=False)
     outfit = db.Column(db.JSON, nullable=False)  # stores list of image relative paths like ['/uploads/img.jpg', ...]
     clothes_ids = db.Column(db.JSON, nullable=False)  # stores list of image_ids like ['abc123', 'def456']
+    outfit_key = db.Column(db.String(1000), nullable=True)  # Saved.make_outfit_key(outfit), for indexed lookups
+
+    __table_args__ = (
+        db.Index("ix_saved_user_event", "user_id", "event"),
+        db.Index("ix_saved_user_event_outfit_key", "user_id", "event", "outfit_key"),
+    )
+
+    @staticmethod
+    def image_filename(path):
+        """'/uploads/ab/cd/abcd.jpg?size=thumb' -> 'ab/cd/abcd.jpg', the ImageModel.image_path it refers to."""
+        path = path.split("?", 1)[0]
+        if "/uploads/" in path:
+            return path.split("/uploads/", 1)[1]
+        return path.rsplit("/", 1)[-1]
+
+    @staticmethod
+    def make_outfit_key(outfit_paths):
+        return "|".join(Saved.image_filename(path) for path in outfit_paths)
 
     def to_dict(self):
         return {
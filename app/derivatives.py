@@ -0,0 +1,44 @@
+import os
+
+from PIL import Image
+
+from app.storage import atomic_write
+
+# Smaller copies of processed uploads for list views, longest side in pixels
+DERIVATIVE_SIZES = {
+    "thumb": 256,
+    "medium": 768,
+}
+
+
+def derivative_path(upload_folder, filename, size):
+    return os.path.join(upload_folder, "derived", size, *filename.split("/"))
+
+
+def make_derivative(src_path, dst_path, size):
+    """Writes a downscaled JPEG copy of src_path, atomically."""
+    with Image.open(src_path) as img:
+        img = img.convert("RGB")
+        img.thumbnail((DERIVATIVE_SIZES[size], DERIVATIVE_SIZES[size]))
+        atomic_write(dst_path, lambda tmp_path: img.save(tmp_path, format="JPEG", quality=85, optimize=True))
+    return dst_path
+
+
+def make_all_derivatives(upload_folder, filename):
+    src_path = os.path.join(upload_folder, *filename.split("/"))
+    for size in DERIVATIVE_SIZES:
+        make_derivative(src_path, derivative_path(upload_folder, filename, size), size)
+
+
+def ensure_derivative(upload_folder, filename, size):
+    """
+    Returns the derivative path, generating it on first request for images that were
+    processed before derivatives existed. None when the original is missing.
+    """
+    dst_path = derivative_path(upload_folder, filename, size)
+    if os.path.exists(dst_path):
+        return dst_path
+    src_path = os.path.join(upload_folder, *filename.split("/"))
+    if not os.path.exists(src_path):
+        return None
+    return make_derivative(src_path, dst_path, size)
@@ -0,0 +1,155 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+EMBEDDING_DIM = 2048
+# Eviction trims to this share of max_items, so the puts that follow do not each trigger
+# another scan of every file
+EVICT_LOW_WATER = 0.9
+
+
+class EmbeddingStore:
+    """
+    On-disk cache of backbone embeddings, one .npy file per (image, model version).
+    - Files live under <root>/<model_version>/<sha1(image_path)>.npy
+    - A small in-memory LRU sits in front of the disk files
+    - Once more than max_items files exist the least recently used ones are evicted down to
+      EVICT_LOW_WATER * max_items, entries written by older model versions go first
+    """
+
+    def __init__(self, root, max_items=5000, memory_items=1024):
+        self.root = root
+        self.max_items = max_items
+        self.memory_items = memory_items
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_count = None
+
+    def _path(self, image_path, model_version):
+        digest = hashlib.sha1(image_path.encode("utf-8")).hexdigest()
+        return os.path.join(self.root, model_version, f"{digest}.npy")
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def get(self, image_path, model_version):
+        key = (image_path, model_version)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+
+        path = self._path(image_path, model_version)
+        try:
+            vector = np.load(path)
+            os.utime(path)  # mark as recently used for eviction
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+
+        if vector.shape != (EMBEDDING_DIM,):
+            return None
+
+        with self._lock:
+            self._remember(key, vector)
+        return vector
+
+    def put(self, image_path, model_version, vector):
+        vector = np.asarray(vector, dtype=np.float32).reshape(EMBEDDING_DIM)
+        path = self._path(image_path, model_version)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a temp file first so readers never see a half-written array
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, vector)
+        existed = os.path.exists(path)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._remember((image_path, model_version), vector)
+            if self._disk_count is None:
+                self._disk_count = self._count_files()
+            elif not existed:
+                self._disk_count += 1
+            over_limit = self._disk_count > self.max_items
+
+        if over_limit:
+            self.evict(model_version)
+
+    def invalidate(self, image_paths):
+        """Drop every cached embedding (all model versions) for the given images."""
+        image_paths = set(image_paths)
+        if not image_paths:
+            return
+
+        with self._lock:
+            for key in [k for k in self._memory if k[0] in image_paths]:
+                del self._memory[key]
+
+        removed = 0
+        for version in self._versions():
+            for image_path in image_paths:
+                try:
+                    os.remove(self._path(image_path, version))
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+
+        with self._lock:
+            if self._disk_count is not None:
+                self._disk_count = max(0, self._disk_count - removed)
+
+    def evict(self, current_version):
+        """Trim the disk cache to its low-water mark, oldest model versions and least recently used first."""
+        entries = []
+        for version in self._versions():
+            version_dir = os.path.join(self.root, version)
+            for name in os.listdir(version_dir):
+                if not name.endswith(".npy"):
+                    continue
+                path = os.path.join(version_dir, name)
+                try:
+                    mtime = os.path.getmtime(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((version == current_version, mtime, path))
+
+        keep = int(self.max_items * EVICT_LOW_WATER)
+        overflow = len(entries) - keep
+        if overflow > 0:
+            entries.sort()
+            for _, _, path in entries[:overflow]:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            print(f"🧹 Evicted {overflow} cached embeddings")
+
+        for version in self._versions():
+            if version != current_version:
+                try:
+                    os.rmdir(os.path.join(self.root, version))
+                except OSError:
+                    pass  # still has entries
+
+        with self._lock:
+            self._disk_count = min(len(entries), keep)
+            for key in [k for k in self._memory if k[1] != current_version]:
+                del self._memory[key]
+
+    def _versions(self):
+        if not os.path.isdir(self.root):
+            return []
+        return [d for d in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, d))]
+
+    def _count_files(self):
+        total = 0
+        for version in self._versions():
+            total += sum(1 for name in os.listdir(os.path.join(self.root, version)) if name.endswith(".npy"))
+        return total
@@ -0,0 +1,197 @@
+import math
+import threading
+from collections import OrderedDict
+
+from app.database import db, User, ImageModel, Saved
+from app.metrics import STAGE_SECONDS
+
+DEFAULT_MIN_SUPPORT = 0.3
+MAX_CACHED_USERS = 256
+
+
+class _Node:
+    __slots__ = ("item", "count", "parent", "children")
+
+    def __init__(self, item, parent):
+        self.item = item
+        self.count = 0
+        self.parent = parent
+        self.children = {}
+
+
+class FPTree:
+    """
+    FP-tree over item-id transactions with a fixed (sorted) item order instead of the usual
+    descending-frequency order. The tree is a little less compact, but a transaction always
+    maps to the same path, so it can be added or removed in place without a rebuild.
+    """
+
+    def __init__(self):
+        self.root = _Node(None, None)
+        self.header = {}  # item -> set of nodes holding it
+        self.item_counts = {}
+
+    def add(self, items, count=1):
+        node = self.root
+        for item in sorted(items):
+            child = node.children.get(item)
+            if child is None:
+                child = node.children[item] = _Node(item, node)
+                self.header.setdefault(item, set()).add(child)
+            child.count += count
+            self.item_counts[item] = self.item_counts.get(item, 0) + count
+            node = child
+
+    def remove(self, items, count=1):
+        """Undoes add(items, count); nodes whose count drops to zero are unlinked."""
+        node = self.root
+        path = []
+        for item in sorted(items):
+            node = node.children[item]
+            path.append(node)
+        for node in reversed(path):
+            node.count -= count
+            self.item_counts[node.item] -= count
+            if node.count == 0:
+                del node.parent.children[node.item]
+                self.header[node.item].discard(node)
+                if not self.header[node.item]:
+                    del self.header[node.item]
+                    del self.item_counts[node.item]
+
+    def mine(self, min_count, suffix=()):
+        """Yields (itemset tuple, count) for every itemset with count >= min_count."""
+        for item, count in self.item_counts.items():
+            if count < min_count:
+                continue
+            itemset = (item,) + suffix
+            yield itemset, count
+
+            # Conditional tree: the prefix paths of every node holding item
+            conditional = FPTree()
+            for node in self.header[item]:
+                prefix = []
+                parent = node.parent
+                while parent.item is not None:
+                    prefix.append(parent.item)
+                    parent = parent.parent
+                if prefix:
+                    conditional.add(prefix, node.count)
+            if conditional.item_counts:
+                yield from conditional.mine(min_count, itemset)
+
+
+def min_count_for(min_support, transactions):
+    # Same threshold as mlxtend's fpgrowth
+    return math.ceil(min_support * transactions)
+
+
+class SavedOutfitMiner:
+    """
+    Frequent item sets over each user's saved outfits, one FP-tree per user kept in memory.
+    - A transaction is the set of a saved outfit's clothes ids that still exist for the user
+    - The tree is updated in place on save/remove, and brought up to date from the saved table
+      when the user's cache_version moved past what it reflects (other processes' changes,
+      deleted images); otherwise a query does not touch the saved table at all
+    - Mined results are cached per (user, min count) until the user's tree changes
+    """
+
+    def __init__(self, max_users=MAX_CACHED_USERS):
+        self.max_users = max_users
+        self._lock = threading.Lock()
+        self._users = OrderedDict()  # user_id -> {"tree", "transactions", "results"}
+
+    def _state(self, user_id):
+        state = self._users.get(user_id)
+        if state is None:
+            state = self._users[user_id] = {"tree": FPTree(), "transactions": {}, "results": {},
+                                            "version": None, "images": {}}
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        self._users.move_to_end(user_id)
+        return state
+
+    @staticmethod
+    def _set_transaction(state, saved_id, items):
+        old = state["transactions"].pop(saved_id, None)
+        if old == items:
+            if items:
+                state["transactions"][saved_id] = items
+            return False
+        if old:
+            state["tree"].remove(old)
+        if items:
+            state["tree"].add(items)
+            state["transactions"][saved_id] = items
+        state["results"].clear()
+        return True
+
+    @staticmethod
+    def _cache_version(user_id):
+        return db.session.query(User.cache_version).filter(User.id == int(user_id)).scalar()
+
+    def _advance(self, user_id, state):
+        """
+        Called after applying the caller's own committed change, which bumped cache_version once:
+        if nothing else changed since the last sync the tree is current at the new version.
+        """
+        version = self._cache_version(user_id)
+        if state["version"] is not None and version == state["version"] + 1:
+            state["version"] = version
+
+    def saved(self, user_id, saved_id, clothes_ids):
+        """Adds a freshly saved outfit (clothes_ids already resolved to the user's images)."""
+        with self._lock:
+            if user_id in self._users:
+                state = self._state(user_id)
+                self._set_transaction(state, saved_id, frozenset(clothes_ids))
+                self._advance(user_id, state)
+
+    def removed(self, user_id, saved_ids):
+        with self._lock:
+            if user_id in self._users:
+                state = self._state(user_id)
+                for saved_id in saved_ids:
+                    self._set_transaction(state, saved_id, frozenset())
+                self._advance(user_id, state)
+
+    def _sync(self, user_id, state):
+        """Applies the differences between the saved table and the tree, returns {id: image_path}."""
+        version = self._cache_version(user_id)
+        if version is not None and version == state["version"]:
+            return state["images"]
+
+        images = dict(db.session.query(ImageModel.id, ImageModel.image_path)
+                      .filter(ImageModel.user_id == int(user_id)).all())
+        rows = dict(db.session.query(Saved.id, Saved.clothes_ids).filter(Saved.user_id == str(user_id)).all())
+
+        for saved_id in set(state["transactions"]) - set(rows):
+            self._set_transaction(state, saved_id, frozenset())
+        for saved_id, clothes_ids in rows.items():
+            self._set_transaction(state, saved_id, frozenset(i for i in clothes_ids or [] if i in images))
+        state["version"] = version
+        state["images"] = images
+        return images
+
+    def frequent_itemsets(self, user_id, min_support=DEFAULT_MIN_SUPPORT):
+        """
+        Returns (transaction count, [(sorted item ids, support), ...], {item id: image_path}),
+        item sets sorted by support, then size.
+        """
+        with self._lock, STAGE_SECONDS.time(stage="fp_growth"):
+            state = self._state(user_id)
+            images = self._sync(user_id, state)
+            transactions = len(state["transactions"])
+            if not transactions:
+                return 0, [], images
+
+            min_count = min_count_for(min_support, transactions)
+            if min_count not in state["results"]:
+                itemsets = [(sorted(items), count / transactions)
+                            for items, count in state["tree"].mine(min_count)]
+                itemsets.sort(key=lambda row: (-row[1], len(row[0]), row[0]))
+                state["results"][min_count] = itemsets
+            return transactions, state["results"][min_count], images
+
+
+miner = SavedOutfitMiner()
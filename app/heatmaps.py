@@ -0,0 +1,131 @@
+import os
+import io
+import hashlib
+import threading
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from app.derivatives import ensure_derivative
+from app.storage import atomic_write
+
+CELL = 96  # pixels per attention cell and per thumbnail
+
+
+def heatmap_key(model_version, outfit):
+    """Cache key of an outfit's heatmap: attention is per outfit, so it only changes with the model."""
+    return hashlib.sha1("\n".join([model_version, *outfit]).encode("utf-8")).hexdigest()
+
+
+class HeatmapCache:
+    """
+    Rendered heatmaps on disk, bounded by total size and evicted least recently used first.
+    - Reads refresh the file's mtime, which is the recency every process agrees on
+    - Writes are atomic (temp file + rename), so concurrent renders of one outfit are harmless
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.directory = os.path.abspath(app.config.get("HEATMAP_DIR", os.path.join("static", "heatmaps")))
+        self.max_bytes = app.config.get("HEATMAP_CACHE_MAX_MB", 64) * 1024 * 1024
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.png")
+
+    def get(self, key):
+        """PNG bytes of a cached heatmap or None."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return data
+
+    def put(self, key, data):
+        def write(tmp_path):
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+
+        atomic_write(self._path(key), write)
+        self.evict()
+
+    def evict(self):
+        """Deletes the least recently used heatmaps until the directory fits max_bytes."""
+        with self._lock:
+            files = []
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(".png"):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:  # evicted by another process
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in files)
+            for _, size, path in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+
+def _thumbnail(upload_folder, filename):
+    path = ensure_derivative(upload_folder, filename, "thumb")
+    if path is None:
+        return Image.new("RGB", (CELL, CELL), (230, 230, 230))
+    with Image.open(path) as img:
+        img = img.convert("RGB")
+    img.thumbnail((CELL, CELL))
+    tile = Image.new("RGB", (CELL, CELL), (255, 255, 255))
+    tile.paste(img, ((CELL - img.width) // 2, (CELL - img.height) // 2))
+    return tile
+
+
+def render_attention(upload_folder, outfit, attention):
+    """
+    PNG of the outfit's global attention: thumbnails along both axes, cell (i, j) shaded by
+    how much image i attends to image j. For outfits under 7 images the blank slots share
+    one last column.
+    - attention: (7, 7) weights from the head, rows are the attending images
+    """
+    n = len(outfit)
+    attention = np.asarray(attention, dtype=np.float32)
+    weights = attention[:n, :n]
+    if n < attention.shape[1]:
+        weights = np.hstack([weights, attention[:n, n:].sum(axis=1, keepdims=True)])
+    scale = float(weights.max()) or 1.0
+
+    canvas = Image.new("RGB", ((weights.shape[1] + 1) * CELL, (n + 1) * CELL), (255, 255, 255))
+    draw = ImageDraw.Draw(canvas)
+    for i, filename in enumerate(outfit):
+        tile = _thumbnail(upload_folder, filename)
+        canvas.paste(tile, ((i + 1) * CELL, 0))
+        canvas.paste(tile, (0, (i + 1) * CELL))
+    if weights.shape[1] > n:
+        draw.text(((n + 1) * CELL + 6, CELL // 2), "empty slots", fill=(120, 120, 120))
+
+    for i in range(n):
+        for j in range(weights.shape[1]):
+            level = weights[i, j] / scale
+            color = (255, int(255 * (1 - level)), int(255 * (1 - level)))  # white -> red
+            x, y = (j + 1) * CELL, (i + 1) * CELL
+            draw.rectangle([x, y, x + CELL - 1, y + CELL - 1], fill=color, outline=(200, 200, 200))
+            draw.text((x + 6, y + 6), f"{weights[i, j]:.2f}", fill=(0, 0, 0))
+
+    buffer = io.BytesIO()
+    canvas.save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue()
+
+
+heatmap_cache = HeatmapCache()
@@ -0,0 +1,48 @@
+import io
+import hashlib
+
+from PIL import Image
+
+# Uploads are fingerprinted twice: the SHA-256 of the bytes finds exact re-uploads, a 64-bit
+# difference hash (dHash) of the decoded image finds re-encoded or resized copies.
+DHASH_SIZE = 8
+
+
+def content_hash(image_bytes):
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def dhash(image_bytes):
+    """
+    Difference hash as 16 hex digits: the image shrunk to 9x8 grayscale, one bit per pair of
+    horizontally adjacent pixels (is the left one brighter). Robust to scaling and recompression.
+    """
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        img.draft("L", (DHASH_SIZE * 8, DHASH_SIZE * 8))  # JPEG: decode at reduced scale
+        small = img.convert("L").resize((DHASH_SIZE + 1, DHASH_SIZE), Image.LANCZOS)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(DHASH_SIZE):
+        for col in range(DHASH_SIZE):
+            left = pixels[row * (DHASH_SIZE + 1) + col]
+            value = (value << 1) | (left > pixels[row * (DHASH_SIZE + 1) + col + 1])
+    return f"{value:016x}"
+
+
+def hamming(a, b):
+    """Number of differing bits between two dhash() values."""
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+
+def near_duplicates(phash, candidates, max_distance):
+    """
+    Ids of the candidates within max_distance bits of phash, closest first.
+    - candidates: (image_id, dhash) pairs, typically the user's images of one category
+    """
+    matches = []
+    for image_id, other in candidates:
+        if other:
+            distance = hamming(phash, other)
+            if distance <= max_distance:
+                matches.append((distance, image_id))
+    return [image_id for _, image_id in sorted(matches)]
@@ -0,0 +1,169 @@
+import os
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+# Backends share one interface, numpy in and numpy out:
+# - version: keys cached embeddings, so vectors from different backends are never mixed
+# - weights_version: version of the checkpoint alone, what ONNX exports are filed under
+# - encode(images (N, 3, 224, 224)) -> (N, 2048)
+# - score_embeddings(embeddings (B, 7, 2048)) -> logits (B, 13), attention (B, 7, 7)
+# - additive_head: AdditiveHead of the same weights, the cheap scorer used for candidate pruning
+INFERENCE_BACKENDS = ("torch", "onnx", "onnx-int8")
+ONNX_OPSET = 17
+
+
+class AdditiveHead:
+    """
+    First-order numpy stand-in for the attention head. Every attention block adds its output
+    to a residual; without them the head is fc per image, then one classifier slice per slot,
+    so logits = bias + sum over slots of a fixed 13-vector per (image, slot) pair.
+    """
+
+    def __init__(self, network):
+        linear1, _, batch_norm, _, linear2, _ = network.fc
+        with torch.no_grad():
+            scale = batch_norm.weight / torch.sqrt(batch_norm.running_var + batch_norm.eps)
+            self.w1 = linear1.weight.T.numpy().copy()
+            self.b1 = linear1.bias.numpy().copy()
+            self.bn_scale = scale.numpy().copy()
+            self.bn_shift = (batch_norm.bias - batch_norm.running_mean * scale).numpy().copy()
+            self.w2 = linear2.weight.T.numpy().copy()
+            self.b2 = linear2.bias.numpy().copy()
+            classifier = network.classifier.weight.numpy()
+            self.slot_weights = classifier.reshape(classifier.shape[0], 7, -1).transpose(1, 2, 0).copy()  # (7, 128, 13)
+            self.bias = network.classifier.bias.numpy().copy()
+
+    def contributions(self, embeddings):
+        """(N, 2048) embeddings -> (N, 7, 13): what each image adds to the logits in each slot."""
+        hidden = np.maximum(embeddings @ self.w1 + self.b1, 0) * self.bn_scale + self.bn_shift
+        refined = np.tanh(hidden @ self.w2 + self.b2)
+        return np.einsum("nk,ske->nse", refined, self.slot_weights)
+
+
+class TorchBackend:
+    """Eager PyTorch SiameseNetwork on CPU."""
+
+    name = "torch"
+
+    def __init__(self, network):
+        self.network = network
+        self.version = network.version
+        self.weights_version = network.version
+        self.additive_head = AdditiveHead(network)
+
+    def encode(self, images):
+        with torch.no_grad():
+            return self.network.encode(torch.from_numpy(np.ascontiguousarray(images, dtype=np.float32))).numpy()
+
+    def score_embeddings(self, embeddings):
+        with torch.no_grad():
+            logits, attention = self.network.score_embeddings(torch.from_numpy(embeddings))
+            return logits.numpy(), attention.numpy()
+
+
+class _Encoder(nn.Module):
+    def __init__(self, network):
+        super().__init__()
+        self.network = network
+
+    def forward(self, images):
+        return self.network.encode(images)
+
+
+class _Head(nn.Module):
+    def __init__(self, network):
+        super().__init__()
+        self.network = network
+
+    def forward(self, embeddings):
+        return self.network.score_embeddings(embeddings)
+
+
+def export_onnx(network, export_dir):
+    """
+    Exports the encoder and the per-outfit head of network to ONNX, once per weights version.
+    Returns (encoder path, head path).
+    """
+    version_dir = os.path.join(export_dir, network.version)
+    os.makedirs(version_dir, exist_ok=True)
+    encoder_path = os.path.join(version_dir, "encoder.onnx")
+    head_path = os.path.join(version_dir, "head.onnx")
+
+    exports = [
+        (_Encoder(network), torch.zeros(2, 3, 224, 224), encoder_path,
+         ["images"], ["embeddings"], {"images": {0: "n"}, "embeddings": {0: "n"}}),
+        (_Head(network), torch.zeros(2, 7, 2048), head_path,
+         ["embeddings"], ["logits", "attention"],
+         {"embeddings": {0: "batch"}, "logits": {0: "batch"}, "attention": {0: "batch"}}),
+    ]
+    for module, sample, path, input_names, output_names, dynamic_axes in exports:
+        if os.path.exists(path):
+            continue
+        print(f"📤 Exporting {os.path.basename(path)} for model {network.version}")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with torch.no_grad():
+            torch.onnx.export(module.eval(), (sample,), tmp_path, input_names=input_names,
+                              output_names=output_names, dynamic_axes=dynamic_axes,
+                              opset_version=ONNX_OPSET, dynamo=False)
+        os.replace(tmp_path, path)
+    return encoder_path, head_path
+
+
+def quantize_onnx(path):
+    """Writes a dynamically quantized int8 copy next to path (weights int8, activations quantized at run time)."""
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    quantized_path = path.replace(".onnx", ".int8.onnx")
+    if not os.path.exists(quantized_path):
+        print(f"📤 Quantizing {os.path.basename(path)} to int8")
+        tmp_path = f"{quantized_path}.{os.getpid()}.tmp"
+        quantize_dynamic(path, tmp_path, weight_type=QuantType.QInt8)
+        os.replace(tmp_path, quantized_path)
+    return quantized_path
+
+
+class OnnxBackend:
+    """
+    SiameseNetwork exported to ONNX and run by onnxruntime on CPU.
+    - quantize: run the head as a dynamically quantized int8 graph. The encoder stays
+      float32: dynamic int8 convolutions (ConvInteger) are slower than float ones on CPU.
+    """
+
+    def __init__(self, network, export_dir, quantize=False, threads=0):
+        import onnxruntime as ort
+
+        self.name = "onnx-int8" if quantize else "onnx"
+        self.version = f"{network.version}-onnx"  # both modes share the float32 encoder
+        self.weights_version = network.version
+        self.additive_head = AdditiveHead(network)
+        encoder_path, head_path = export_onnx(network, export_dir)
+        if quantize:
+            head_path = quantize_onnx(head_path)
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.encoder = ort.InferenceSession(encoder_path, options, providers=["CPUExecutionProvider"])
+        self.head = ort.InferenceSession(head_path, options, providers=["CPUExecutionProvider"])
+
+    def encode(self, images):
+        return self.encoder.run(None, {"images": np.ascontiguousarray(images, dtype=np.float32)})[0]
+
+    def score_embeddings(self, embeddings):
+        logits, attention = self.head.run(None, {"embeddings": np.ascontiguousarray(embeddings, dtype=np.float32)})
+        return logits, attention
+
+
+def create_backend(network, name="torch", export_dir=None, threads=0):
+    """
+    Wraps a loaded SiameseNetwork in the named backend.
+    - name: one of INFERENCE_BACKENDS
+    - export_dir: where ONNX exports are kept, one folder per weights version
+    """
+    if name == "torch":
+        return TorchBackend(network)
+    if name in ("onnx", "onnx-int8"):
+        return OnnxBackend(network, export_dir, quantize=name == "onnx-int8", threads=threads)
+    raise ValueError(f"Unknown inference backend {name!r}, expected one of {', '.join(INFERENCE_BACKENDS)}")
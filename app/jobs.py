@@ -0,0 +1,215 @@
+import json
+import time
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import update, exists, and_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
+
+from app.database import db, ImageModel, RecommendationJob
+from app.recommend_outfits import generate_recommendations, cache_embeddings
+
+
+class RecommendationScheduler:
+    """
+    In-process scheduler for recommendation runs backed by the recommendation_job table.
+    - A fixed pool of worker threads claims pending jobs, never two at once for the same user
+    - At most one pending job exists per user: new requests are merged into it
+    - Jobs left running by a dead process are put back to pending once their heartbeat is stale
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._wake = threading.Condition()
+        self._threads = []
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.workers = app.config.get("RECOMMENDATION_WORKERS", 2)
+        self.poll_interval = app.config.get("RECOMMENDATION_POLL_SECONDS", 5)
+        self.stale_after = timedelta(seconds=app.config.get("RECOMMENDATION_JOB_STALE_SECONDS", 300))
+
+    def start(self):
+        """Starts the worker threads (once per process)."""
+        if self._threads:
+            return
+        with self.app.app_context():
+            self._requeue_stale()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker_loop, name=f"recommendation-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        print(f"🧵 Started {self.workers} recommendation workers")
+
+    def enqueue(self, user_id, new_image_paths=None):
+        """
+        Schedules a recommendation run for the user, merging it with their pending job if any.
+        - new_image_paths: incremental run for these images; None asks for a full rebuild
+        """
+        full_rebuild = new_image_paths is None
+        paths = sorted(set(new_image_paths or []))
+        while True:
+            job = RecommendationJob.query.filter_by(user_id=user_id, status="pending").first()
+            if job is None:
+                job = RecommendationJob(user_id=user_id, full_rebuild=full_rebuild, new_image_paths=json.dumps(paths))
+                db.session.add(job)
+                try:
+                    db.session.commit()
+                    break
+                except IntegrityError:
+                    db.session.rollback()  # another process queued one first: merge into it
+                    continue
+            if self._merge(job, full_rebuild, paths):
+                break
+            # A worker claimed the job or another request merged into it since it was read
+
+        with self._wake:
+            self._wake.notify()
+        return job
+
+    @staticmethod
+    def _merge(job, full_rebuild, paths):
+        """
+        Merges a request into the pending job as read. The UPDATE only matches if the job is
+        still pending and unchanged, so nothing is merged into a job a worker already started.
+        Returns False when it did not match.
+        """
+        if full_rebuild or job.full_rebuild:
+            values = {"full_rebuild": True, "new_image_paths": "[]"}
+        else:
+            values = {"new_image_paths": json.dumps(sorted(set(json.loads(job.new_image_paths)) | set(paths)))}
+        result = db.session.execute(
+            update(RecommendationJob)
+            .where(RecommendationJob.id == job.id, RecommendationJob.status == "pending",
+                   RecommendationJob.full_rebuild == job.full_rebuild,
+                   RecommendationJob.new_image_paths == job.new_image_paths)
+            .values(updated_at=datetime.utcnow(), **values)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        return result.rowcount == 1
+
+    def status(self, user_id):
+        """Latest job of the user, or None if nothing was ever scheduled."""
+        return (RecommendationJob.query.filter_by(user_id=user_id)
+                .order_by(RecommendationJob.id.desc()).first())
+
+    def queue_depth(self):
+        return RecommendationJob.query.filter_by(status="pending").count()
+
+    def _worker_loop(self):
+        last_stale_check = time.monotonic()
+        while True:
+            job_id = None
+            try:
+                with self.app.app_context():
+                    if time.monotonic() - last_stale_check > self.stale_after.total_seconds():
+                        self._requeue_stale()
+                        last_stale_check = time.monotonic()
+                    job_id = self._claim()
+                    if job_id is not None:
+                        self._run(job_id)
+            except Exception as e:
+                print(f"❌ Recommendation worker error: {e}")
+
+            if job_id is None:
+                with self._wake:
+                    self._wake.wait(self.poll_interval)
+
+    def _claim(self):
+        """Atomically moves the oldest claimable pending job to running, returns its id."""
+        running = aliased(RecommendationJob)
+        user_busy = exists().where(and_(running.user_id == RecommendationJob.user_id, running.status == "running"))
+
+        candidates = (RecommendationJob.query
+                      .filter(RecommendationJob.status == "pending", ~user_busy)
+                      .order_by(RecommendationJob.id).limit(self.workers + 1).all())
+        for job in candidates:
+            busy = exists().where(and_(running.user_id == job.user_id, running.status == "running"))
+            result = db.session.execute(
+                update(RecommendationJob)
+                .where(RecommendationJob.id == job.id, RecommendationJob.status == "pending", ~busy)
+                .values(status="running", progress=0.0, updated_at=datetime.utcnow())
+            )
+            db.session.commit()
+            if result.rowcount == 1:
+                return job.id
+        return None
+
+    def _run(self, job_id):
+        job = db.session.get(RecommendationJob, job_id)
+        db.session.refresh(job)
+        user_id = job.user_id
+        new_image_paths = None if job.full_rebuild else json.loads(job.new_image_paths)
+        print(f"🔥 Running recommendation job {job_id} for user {user_id}")
+
+        last_report = [0.0]
+
+        def report(done, total):
+            # Doubles as the heartbeat, throttled to keep SQLite writes cheap
+            now = time.monotonic()
+            if now - last_report[0] < 1.0 and done < total:
+                return
+            last_report[0] = now
+            self._set(job_id, progress=done / total if total else 1.0)
+
+        try:
+            if new_image_paths:
+                # Images deleted while the job was pending are gone from disk: score the others
+                ready = {path for (path,) in db.session.query(ImageModel.image_path).filter(
+                    ImageModel.user_id == user_id, ImageModel.status == "ready",
+                    ImageModel.image_path.in_(new_image_paths))}
+                new_image_paths = [path for path in new_image_paths if path in ready]
+                if not new_image_paths:
+                    # Their recommendations were dropped on delete, nothing is left to add
+                    self._set(job_id, status="done", progress=1.0)
+                    return
+                cache_embeddings(user_id, new_image_paths)
+            generate_recommendations(user_id, new_image_paths=new_image_paths, progress=report)
+            self._set(job_id, status="done", progress=1.0)
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ Recommendation job {job_id} failed: {e}")
+            self._set(job_id, status="failed", error=str(e))
+
+    def _set(self, job_id, **values):
+        db.session.execute(
+            update(RecommendationJob)
+            .where(RecommendationJob.id == job_id)
+            .values(updated_at=datetime.utcnow(), **values)
+        )
+        db.session.commit()
+
+    def _requeue_stale(self):
+        cutoff = datetime.utcnow() - self.stale_after
+        pending = aliased(RecommendationJob)
+        stale = RecommendationJob.query.filter(RecommendationJob.status == "running",
+                                               RecommendationJob.updated_at < cutoff).all()
+        requeued = 0
+        for job in stale:
+            is_stale = and_(RecommendationJob.id == job.id, RecommendationJob.status == "running",
+                            RecommendationJob.updated_at < cutoff)
+            has_pending = exists().where(and_(pending.user_id == job.user_id, pending.status == "pending"))
+            result = db.session.execute(
+                update(RecommendationJob).where(is_stale, ~has_pending)
+                .values(status="pending", progress=0.0, updated_at=datetime.utcnow())
+            )
+            db.session.commit()
+            if result.rowcount == 0:
+                # The user has a newer pending job: fold the interrupted run into it
+                result = db.session.execute(
+                    update(RecommendationJob).where(is_stale)
+                    .values(status="failed", error="Interrupted, merged into a newer job", updated_at=datetime.utcnow())
+                )
+                db.session.commit()
+                if result.rowcount == 0:
+                    continue  # its worker reported progress after all
+                self.enqueue(job.user_id, None if job.full_rebuild else json.loads(job.new_image_paths))
+            requeued += 1
+        if requeued:
+            print(f"♻️ Re-queued {requeued} interrupted recommendation jobs")
+
+scheduler = RecommendationScheduler()
@@ -1,100 +1,241 @@
-from flask import Flask, request, jsonify, send_from_directory, abort
+from flask import Flask, Response, request, jsonify, send_from_directory, abort, stream_with_context
 from flask_bcrypt import Bcrypt
 from flask_cors import CORS
-from werkzeug.utils import secure_filename
+from werkzeug.security import safe_join
 import os
-import uuid
-import threading
 import io
-import requests
-from app.database import db, ImageModel, RecommendationResult, User, Saved
-from app.recommend_outfits import load_model, generate_recommendations
+import time
+import threading
+from app.database import db, ImageModel, RecommendationResult, RecommendationScore, User, Saved
+from app.jobs import scheduler
+from app.background_removal import pipeline as bg_pipeline
+from app.derivatives import DERIVATIVE_SIZES, ensure_derivative
+from app.recommend_outfits import (get_model, get_network, warm_up, get_loaded_model, get_loaded_network,
+                                   invalidate_images, remove_images_from_recommendations, outfit_attention)
+from app.migrations import run_migrations
+from app.fp_growth import miner as fp_miner, DEFAULT_MIN_SUPPORT
+from app.metrics import metrics, STAGE_SECONDS
+from app.response_cache import response_cache
+from app.parallel_scoring import scoring_pool
+from app.heatmaps import heatmap_cache, heatmap_key, render_attention
+from app.image_hashes import content_hash, dhash, near_duplicates
+from app.storage import storage, shard_key, RESERVED_DIRS
+from sqlalchemy import or_, and_, text, tuple_
 import json
-from mlxtend.frequent_patterns import fpgrowth
-from mlxtend.preprocessing import TransactionEncoder
-import pandas as pd
-from rembg import remove
+from urllib.parse import urlencode
 from PIL import Image
 
 # Initialize Flask App
 app = Flask(__name__)
 CORS(app)  # Enable CORS for React Native
 
-# Ensure Database & Uploads Folder Exists
-os.makedirs("assets", exist_ok=True)
-os.makedirs("uploads", exist_ok=True)
-
 # SQLite3 Database Configuration
-app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + os.path.abspath("assets/database.db")
+DATABASE_PATH = os.path.abspath(os.environ.get("DATABASE_PATH", "assets/database.db"))
+app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + DATABASE_PATH
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-app.config["UPLOAD_FOLDER"] = "uploads"
+app.config["UPLOAD_FOLDER"] = os.environ.get("UPLOAD_FOLDER", "uploads")
+
+# Ensure Database & Uploads Folder Exists
+os.makedirs(os.path.dirname(DATABASE_PATH), exist_ok=True)
+os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
+app.config["UPLOAD_CACHE_SECONDS"] = int(os.environ.get("UPLOAD_CACHE_SECONDS", 365 * 24 * 3600))
+# Orphaned upload files are swept in steps of STORAGE_GC_BATCH files every STORAGE_GC_INTERVAL_SECONDS
+# (0 disables the sweep); files younger than the grace period are never touched
+app.config["STORAGE_GC_INTERVAL_SECONDS"] = int(os.environ.get("STORAGE_GC_INTERVAL_SECONDS", 10))
+app.config["STORAGE_GC_BATCH"] = int(os.environ.get("STORAGE_GC_BATCH", 1000))
+app.config["STORAGE_GC_GRACE_SECONDS"] = int(os.environ.get("STORAGE_GC_GRACE_SECONDS", 3600))
+# Prefix of the image URLs in responses (e.g. https://api.example.com); unset uses the request's host
+app.config["PUBLIC_BASE_URL"] = os.environ.get("PUBLIC_BASE_URL", "")
+
+# Recommendation search: outfits kept per event and memory available for one scoring chunk
+app.config["RECOMMENDATION_TOP_K"] = int(os.environ.get("RECOMMENDATION_TOP_K", 50))
+app.config["RECOMMENDATION_MEMORY_BUDGET_MB"] = int(os.environ.get("RECOMMENDATION_MEMORY_BUDGET_MB", 256))
+app.config["RECOMMENDATION_WRITE_CHUNK"] = int(os.environ.get("RECOMMENDATION_WRITE_CHUNK", 500))
+# Two-stage search: a cheap scorer ("head" or "cosine") passes this share of the outfits on to the
+# full model, 1.0 scores every outfit (benchmarks/bench_pruning.py reports the recall)
+app.config["RECOMMENDATION_PRUNE_RATIO"] = float(os.environ.get("RECOMMENDATION_PRUNE_RATIO", 1.0))
+app.config["RECOMMENDATION_PRUNE_SCORER"] = os.environ.get("RECOMMENDATION_PRUNE_SCORER", "head")
+# Score large outfit spaces in this many processes (0 = in the job's thread); each runs torch with
+# RECOMMENDATION_SCORING_THREADS threads, 0 = cores / processes (benchmarks/bench_scoring.py reports the scaling)
+app.config["RECOMMENDATION_SCORING_WORKERS"] = int(os.environ.get("RECOMMENDATION_SCORING_WORKERS", 0))
+app.config["RECOMMENDATION_SCORING_THREADS"] = int(os.environ.get("RECOMMENDATION_SCORING_THREADS", 0))
+
+MAX_IMAGE_PAGE = 500
+DEFAULT_RECOMMEND_THRESHOLD = 0.60
+DEFAULT_RECOMMEND_LIMIT = 50
+MAX_RECOMMEND_LIMIT = 200
+
+# Model inference: "torch", "onnx" or "onnx-int8" (dynamically quantized)
+app.config["INFERENCE_BACKEND"] = os.environ.get("INFERENCE_BACKEND", "torch")
+app.config["INFERENCE_THREADS"] = int(os.environ.get("INFERENCE_THREADS", 0))  # 0 = runtime default
+app.config["ONNX_EXPORT_DIR"] = os.environ.get("ONNX_EXPORT_DIR", os.path.abspath("assets/onnx"))
+
+# Load the model in a background thread at startup ("background") or on first use ("lazy")
+app.config["MODEL_WARMUP"] = os.environ.get("MODEL_WARMUP", "background")
+# Set by gunicorn.conf.py under preload_app: the master imports this module and only loads the
+# weights, the forked workers share them copy-on-write and start their threads in post_fork
+app.config["PRELOAD_MODEL"] = os.environ.get("PRELOAD_MODEL") == "1"
+
+# Serialized responses of the per-user read endpoints, kept per process
+app.config["RESPONSE_CACHE_MAX_ENTRIES"] = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", 1024))
+app.config["RESPONSE_CACHE_MAX_MB"] = int(os.environ.get("RESPONSE_CACHE_MAX_MB", 32))
+
+# Attention heatmaps are rendered when an outfit is opened and kept on disk, least recently used evicted first
+app.config["HEATMAP_DIR"] = os.environ.get("HEATMAP_DIR", os.path.join("static", "heatmaps"))
+app.config["HEATMAP_CACHE_MAX_MB"] = int(os.environ.get("HEATMAP_CACHE_MAX_MB", 64))
+
+# Uploads within this many dHash bits (of 64) of an image in the same category are reported
+# as near-duplicates; the client can send near_duplicates=skip to not store them at all
+app.config["NEAR_DUPLICATE_MAX_DISTANCE"] = int(os.environ.get("NEAR_DUPLICATE_MAX_DISTANCE", 6))
+
+# Background recommendation jobs
+app.config["RECOMMENDATION_WORKERS"] = int(os.environ.get("RECOMMENDATION_WORKERS", 2))
+app.config["RECOMMENDATION_JOB_STALE_SECONDS"] = int(os.environ.get("RECOMMENDATION_JOB_STALE_SECONDS", 300))
+
+# Background removal pool (one long-lived rembg session per process)
+app.config["BACKGROUND_REMOVAL_WORKERS"] = int(os.environ.get("BACKGROUND_REMOVAL_WORKERS", 2))
+app.config["REMBG_MODEL"] = os.environ.get("REMBG_MODEL", "u2net")
+app.config["BACKGROUND_REMOVAL"] = os.environ.get("BACKGROUND_REMOVAL", "rembg")  # "none" skips the cut-out
 
 bcrypt = Bcrypt(app)
 db.init_app(app)
+scheduler.init_app(app)
+bg_pipeline.init_app(app)
+metrics.init_app(app)
+response_cache.init_app(app)
+scoring_pool.init_app(app)
+heatmap_cache.init_app(app)
+storage.init_app(app)
+
+metrics.gauge("morphfit_recommendation_queue_depth", "Pending recommendation jobs (all processes).",
+              scheduler.queue_depth)
+metrics.gauge("morphfit_background_removal_in_flight", "Uploads queued or in background removal in this process.",
+              bg_pipeline.in_flight)
+metrics.gauge("morphfit_response_cache_bytes", "Size of the cached read responses in this process.",
+              lambda: response_cache.stats()[1])
+
+# Model readiness, reported by /ready
+model_state = {"status": "not_loaded", "error": None, "backend": None, "version": None, "seconds": None}
+
+
+def warm_up_model():
+    """Loads the model and runs one pass through it, recording the outcome in model_state."""
+    model_state["status"] = "loading"
+    start = time.perf_counter()
+    try:
+        with app.app_context():
+            backend = warm_up()
+        model_state.update(status="ready", backend=backend.name, version=backend.version, error=None)
+    except Exception as e:
+        print(f"❌ Model failed to load: {e}")
+        model_state.update(status="failed", error=str(e))
+    model_state["seconds"] = round(time.perf_counter() - start, 3)
+    if model_state["status"] == "ready":
+        print(f"🔥 Model warmed up in {model_state['seconds']}s")
+
+
+def preload_model():
+    """
+    Loads the weights in the gunicorn master before the workers are forked: no inference pass, no threads.
+    Only the torch network: each worker wraps it in its backend, since ONNX export runs the model
+    and onnxruntime sessions start thread pools that do not survive a fork.
+    """
+    try:
+        with app.app_context():
+            get_network()
+        print("📦 Model preloaded, workers will share its weights")
+    except Exception as e:
+        print(f"❌ Model failed to preload, workers will retry: {e}")
 
-# Automatically download model from Google Drive if not present
-def download_model():
-    model_path = os.path.join("siamese_model.pt")
-    model_url = "https://drive.google.com/uc?export=download&id=1KoyusogBnMQEtqAaY2JvlbaV1vRbHMql"
-
-    if not os.path.exists(model_path):
-        print("🔽 Downloading Siamese model from Google Drive...")
-        try:
-            response = requests.get(model_url)
-            with open(model_path, 'wb') as f:
-                f.write(response.content)
-            print("✅ Model downloaded successfully.")
-        except Exception as e:
-            print(f"❌ Failed to download model: {e}")
-    else:
-        print("📦 Model already exists locally.")
 
+def start_background_services():
+    """Starts the model warm-up, the recommendation workers, pending background removals and the storage sweep (once per process)."""
+    if app.config["MODEL_WARMUP"] == "background" or get_loaded_network() is not None:
+        threading.Thread(target=warm_up_model, name="model-warmup", daemon=True).start()
+    scheduler.start()
+    bg_pipeline.resume()
+    storage.start()
 
 
 with app.app_context():
     db.create_all()
+    run_migrations()
+
+if app.config["PRELOAD_MODEL"]:
+    preload_model()
+else:
+    start_background_services()
+
+
+@app.route("/ready", methods=["GET"])
+def ready():
+    """
+    Readiness probe: 200 once the database answers and the model is loaded, 503 before that.
+    With MODEL_WARMUP=lazy the model is only loaded by the first job that needs it, so the
+    probe passes as soon as the database answers (unless a preloaded warm-up is still running).
+    """
     try:
-        download_model()  # safe download
-        model = load_model()  # this should not raise anything
+        db.session.execute(text("SELECT 1"))
     except Exception as e:
-        print(f"❌ Model failed to load: {e}")
-        model = None  # fail gracefully
+        return jsonify({"status": "unavailable", "error": f"Database error: {e}"}), 503
+
+    backend = get_loaded_model()
+    if backend is None and app.config["MODEL_WARMUP"] == "lazy" and model_state["status"] == "not_loaded":
+        return jsonify({"status": "ready", "backend": None, "model_version": None, "warmup_seconds": None}), 200
+    warming_up = model_state["status"] in ("loading", "failed")
+    if backend is None or warming_up:
+        return jsonify({"status": model_state["status"], "error": model_state["error"]}), 503
+    return jsonify({
+        "status": "ready",
+        "backend": backend.name,
+        "model_version": backend.version,
+        "warmup_seconds": model_state["seconds"]
+    }), 200
+
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """Request latency per route, hot-path stage timings and queue depths in Prometheus text format."""
+    return metrics.response()
 
 
 # Endpoint to serve uploaded images
-@app.route("/uploads/<filename>")
+# Files are validated when the background-removal worker writes them, so serving is a plain
+# conditional send: ETag/Last-Modified, 304s and Range requests come from send_from_directory.
+# Upload filenames are content hashes (or unique legacy names) and never rewritten, so clients may cache them for good.
+@app.route("/uploads/<path:filename>")
 def get_uploaded_file(filename):
     upload_folder = os.path.abspath(app.config["UPLOAD_FOLDER"])
-    file_path = os.path.join(upload_folder, filename)
-
-    if not os.path.exists(file_path):
-        print(f"❌ File not found: {file_path}")
+    size = request.args.get("size")
+    if filename.split("/", 1)[0] in RESERVED_DIRS:
         return abort(404)
 
-    try:
-        with open(file_path, 'rb') as f:
-            image_bytes = f.read()
-            if len(image_bytes) < 1000:
-                print(f"❌ Image too small or empty: {filename}")
-                return abort(400, description="Corrupted or incomplete image")
-            img = Image.open(io.BytesIO(image_bytes))
-            img.verify()
-        return send_from_directory(upload_folder, filename)
-    except Exception as e:
-        print(f"❌ Corrupted or unreadable image: {filename} - {e}")
-        return abort(500, description="Corrupted image file.")
+    if size:
+        if size not in DERIVATIVE_SIZES:
+            return abort(400, description=f"Unknown size, use one of: {', '.join(DERIVATIVE_SIZES)}")
+        if safe_join(upload_folder, filename) is None:
+            return abort(404)
+        try:
+            file_path = ensure_derivative(upload_folder, filename, size)
+        except Exception as e:
+            print(f"❌ Could not build {size} derivative of {filename}: {e}")
+            return abort(500, description="Corrupted image file.")
+        if file_path is None:
+            return abort(404)
+        directory = os.path.join(upload_folder, "derived", size)
+    else:
+        directory = upload_folder
+
+    response = send_from_directory(directory, filename, max_age=app.config["UPLOAD_CACHE_SECONDS"])
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
 
-# All remaining routes (register, login, upload, recommend, etc.) stay unchanged.
-# Only change: make sure image URLs use public API base URL like:
-# https://your-backend.onrender.com/uploads/<filename>
 
-# For example, in upload_multiple_images() and get_user_images(), replace:
-#   "http://172.16.100.209:5000/uploads/{filename}"
-# with:
-#   f"{request.host_url}uploads/{filename}"  (automatically uses current domain)
+def public_base_url():
+    """Prefix for absolute URLs in this request's response: PUBLIC_BASE_URL, else the request's host."""
+    return (app.config["PUBLIC_BASE_URL"] or request.host_url).rstrip("/")
 
-# Example usage:
-# image_path = f"{request.host_url}uploads/{filename}"
 
 # The rest of your routes should follow same pattern for compatibility when deployed.
 # REGISTERS USERS
@@ -132,14 +273,9 @@ def login():
         existing = RecommendationResult.query.filter_by(user_id=user.id).first()
         print(existing)
         if not existing:
-            def threaded_recommendation(uid):
-                with app.app_context():
-                    generate_recommendations(uid)
             print(f"🟢 NO EXISTING recommendations found for user {user.id}, triggering generation")
-            background_thread = threading.Thread(target=threaded_recommendation, args=(user.id,))
-            background_thread.start()
-
-            print(f"🔥 Background thread started for user {user.id}")
+            job = scheduler.enqueue(user.id)
+            print(f"🔥 Recommendation job {job.id} queued for user {user.id}")
         else:
             print("EXISTING RECOMMENDATIONS")
         return jsonify({"message": "Login successful", "user_id": user.id}), 200
@@ -156,21 +292,11 @@ def upload_multiple_images():
 
         user_id = int(request.form["user_id"])
         category = request.form["category"]
+        skip_near_duplicates = request.form.get("near_duplicates") == "skip"
 
         if not db.session.get(User, user_id):
             return jsonify({"error": "Invalid user ID"}), 400
 
-        RecommendationResult.query.filter_by(user_id=user_id).delete()
-        db.session.commit()
-        print(f"🧹 Cleared old recommendations for user {user_id}")
-
-        heatmap_dir = "static"
-        if os.path.exists(heatmap_dir):
-            for f in os.listdir(heatmap_dir):
-                if f.startswith(f"heatmap_{user_id}_"):
-                    os.remove(os.path.join(heatmap_dir, f))
-            print(f"🧹 Cleared heatmaps for user {user_id}")
-
         category_prefix = {
             "Tops": "TOP",
             "Bottoms": "BTM",
@@ -186,62 +312,93 @@ def upload_multiple_images():
         existing_images = ImageModel.query.filter_by(category=category).count()
         start_number = existing_images + 1
 
+        base_url = public_base_url()
         uploaded_images = []
+        new_images = []  # (ImageModel, raw bytes)
         images = request.files.getlist("images")
         os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
 
-        for idx, image in enumerate(images):
-            unique_number = start_number + idx
-            image_id = f"{category_code}{unique_number:02d}"
-
-            base_name = secure_filename(image.filename).rsplit('.', 1)[0]
-            filename = f"{uuid.uuid4().hex}_{base_name}.jpg"
-            save_path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-
-            # ✅ Read image bytes into memory
+        # ✅ Validate every image before anything is written
+        staged = []
+        for image in images:
             image_bytes = image.read()
             if len(image_bytes) < 1000:
                 return jsonify({"error": "Uploaded image is too small or empty."}), 400
 
-            # ✅ Validate image (corruption check)
-            input_image = Image.open(io.BytesIO(image_bytes))
-            input_image.verify()
+            try:
+                with STAGE_SECONDS.time(stage="upload_verify"):
+                    Image.open(io.BytesIO(image_bytes)).verify()
+            except Exception:
+                return jsonify({"error": f"Corrupted image: {image.filename}"}), 400
+            with STAGE_SECONDS.time(stage="upload_hash"):
+                staged.append((image.filename, image_bytes, content_hash(image_bytes), dhash(image_bytes)))
+
+        # ✅ Exact re-uploads reuse the stored image (and its cached embedding) instead of adding a row
+        usable = ImageModel.query.filter(ImageModel.user_id == user_id, ImageModel.status != "failed")
+        known = {img.content_hash: img for img in
+                 usable.filter(ImageModel.content_hash.in_({digest for _, _, digest, _ in staged})).all()}
+        similar = [(image_id, phash) for image_id, phash in
+                   usable.filter(ImageModel.category == category, ImageModel.phash.isnot(None))
+                   .with_entities(ImageModel.id, ImageModel.phash).all()]
+        max_distance = app.config["NEAR_DUPLICATE_MAX_DISTANCE"]
+
+        for original_name, image_bytes, digest, phash in staged:
+            if digest in known:
+                existing = known[digest]
+                uploaded_images.append({
+                    "image_id": existing.id,
+                    "image_path": f"{base_url}/uploads/{existing.image_path}",
+                    "status": existing.status,
+                    "duplicate_of": existing.id
+                })
+                continue
 
-            # ✅ Reopen after verify and convert to RGBA
-            input_image = Image.open(io.BytesIO(image_bytes)).convert("RGBA")
-            output_image = remove(input_image)
+            close = near_duplicates(phash, similar, max_distance)
+            if close and skip_near_duplicates:
+                uploaded_images.append({"filename": original_name, "status": "skipped", "near_duplicates": close})
+                continue
 
-            # ✅ Paste onto white background
-            white_bg = Image.new("RGB", output_image.size, (255, 255, 255))
-            white_bg.paste(output_image, mask=output_image.split()[3])
-            white_bg.save(save_path, format="JPEG")
+            image_id = f"{category_code}{start_number + len(new_images):02d}"
+            filename = shard_key(digest)
 
-            # ✅ Save record to DB
             new_image = ImageModel(
                 id=image_id,
                 image_path=filename,
                 category=category,
-                user_id=user_id
+                user_id=user_id,
+                status="processing",
+                content_hash=digest,
+                phash=phash
             )
             db.session.add(new_image)
-            uploaded_images.append({
+            new_images.append((new_image, image_bytes))
+            known[digest] = new_image
+            similar.append((image_id, phash))
+            entry = {
                 "image_id": image_id,
-                "image_path": f"http://172.16.100.209:5000/uploads/{filename}"
-            })
-
-        db.session.commit()
-
-        def run_with_context(uid):
-            with app.app_context():
-                generate_recommendations(uid)
-
-        background_thread = threading.Thread(target=run_with_context, args=(user_id,))
-        background_thread.start()
+                "image_path": f"{base_url}/uploads/{filename}",
+                "status": "processing"
+            }
+            if close:
+                entry["near_duplicates"] = close
+            uploaded_images.append(entry)
+
+        if new_images:
+            with STAGE_SECONDS.time(stage="db_write"):
+                User.bump_cache_version(user_id)
+                db.session.commit()
+
+        # ✅ Stage raw bytes, background removal happens on the worker pool
+        for img, image_bytes in new_images:
+            with STAGE_SECONDS.time(stage="upload_staging"):
+                with open(bg_pipeline.staging_path(img.id), "wb") as f:
+                    f.write(image_bytes)
+                bg_pipeline.submit(img.id, img.image_path)
 
         return jsonify({
-            "message": "Images uploaded successfully! Background removed and recommendations are being generated.",
+            "message": "Images received! Backgrounds are being removed, poll /upload-status for progress.",
             "images": uploaded_images
-        }), 201
+        }), 202
 
     except Exception as e:
         print(f"❌ Flask Image Upload Error: {str(e)}")
@@ -249,6 +406,43 @@ def upload_multiple_images():
 
 
 
+def update_recommendations_after_delete(removed):
+    """
+    Drops only the recommendations that used deleted images. If a deletion changes which
+    outfit shapes are possible (e.g. the last bottoms are gone) or removes one of an event's
+    top K outfits, a full rebuild is queued.
+    - removed: (user_id, image_path, category) tuples of the deleted images
+    """
+    by_user = {}
+    for uid, image_path, category in removed:
+        by_user.setdefault(uid, []).append((image_path, category))
+
+    for uid, images in by_user.items():
+        if not remove_images_from_recommendations(uid, images):
+            scheduler.enqueue(uid)
+
+
+@app.route("/upload-status", methods=["GET"])
+def upload_status():
+    image_ids = [i for i in request.args.get("image_ids", "").split(",") if i]
+    if not image_ids:
+        return jsonify({"error": "Missing image_ids"}), 400
+
+    images = ImageModel.query.filter(ImageModel.id.in_(image_ids)).all()
+    found = {img.id: img for img in images}
+
+    return jsonify({
+        "images": [
+            {
+                "image_id": image_id,
+                "status": found[image_id].status if image_id in found else "missing",
+                "error": found[image_id].error if image_id in found else None
+            }
+            for image_id in image_ids
+        ]
+    }), 200
+
+
 # DELETE CLOTHES ONE AT A TIME
 @app.route("/delete-images", methods=["POST"])
 def delete_images():
@@ -259,8 +453,15 @@ def delete_images():
         if not image_ids:
             return jsonify({"error": "No images selected"}), 400
 
+        deleted = ImageModel.query.filter(ImageModel.id.in_(image_ids)).all()
+        removed = [(img.user_id, img.image_path, img.category) for img in deleted]
         ImageModel.query.filter(ImageModel.id.in_(image_ids)).delete(synchronize_session=False)
+        for user_id in {user_id for user_id, _, _ in removed}:
+            User.bump_cache_version(user_id)
         db.session.commit()
+        invalidate_images([(user_id, image_path) for user_id, image_path, _ in removed])
+        storage.remove(image_path for _, image_path, _ in removed)
+        update_recommendations_after_delete(removed)
         return jsonify({"message": "Selected images deleted"}), 200
 
     except Exception as e:
@@ -270,88 +471,301 @@ def delete_images():
 @app.route("/delete-all/<category>", methods=["DELETE"])
 def delete_all_images(category):
     try:
+        deleted = ImageModel.query.filter_by(category=category).all()
+        removed = [(img.user_id, img.image_path, img.category) for img in deleted]
         ImageModel.query.filter_by(category=category).delete()
+        for user_id in {user_id for user_id, _, _ in removed}:
+            User.bump_cache_version(user_id)
         db.session.commit()
+        invalidate_images([(user_id, image_path) for user_id, image_path, _ in removed])
+        storage.remove(image_path for _, image_path, _ in removed)
+        update_recommendations_after_delete(removed)
         return jsonify({"message": "All images deleted"}), 200
 
     except Exception as e:
         return jsonify({"error": f"Server error: {str(e)}"}), 500
 
+def image_entry(img, base_url):
+    return {
+        "id": img.id,
+        "image_path": f"{base_url}/uploads/{img.image_path}",
+        "thumbnail_path": f"{base_url}/uploads/{img.image_path}?size=thumb",
+        "category": img.category,
+        "status": img.status
+    }
+
+
+def list_images(user_id, category=None):
+    """
+    A user's images (of one category if given) ordered by image id.
+    - limit/after: keyset pagination; when there are more images the next page's cursor is
+      returned in the X-Next-Cursor header (and as a Link header)
+    - format=ndjson: one JSON object per line, streamed from the database in batches
+      instead of building the whole list in memory
+    """
+    try:
+        limit = int(request.args["limit"]) if request.args.get("limit") else None
+        if limit is not None and not 0 < limit <= MAX_IMAGE_PAGE:
+            raise ValueError
+    except ValueError:
+        return jsonify({"error": f"limit must be between 1 and {MAX_IMAGE_PAGE}"}), 400
+    after = request.args.get("after") or None
+    ndjson = request.args.get("format") == "ndjson"
+    base_url = public_base_url()
+
+    query = ImageModel.query.filter(ImageModel.user_id == user_id)
+    if category is not None:
+        query = query.filter(ImageModel.category == category)
+    if after:
+        query = query.filter(ImageModel.id > after)
+    query = query.order_by(ImageModel.id)
+
+    def build():
+        if ndjson and limit is None:
+            def lines():
+                for img in query.yield_per(200):
+                    yield json.dumps(image_entry(img, base_url)) + "\n"
+            return Response(stream_with_context(lines()), mimetype="application/x-ndjson")
+
+        images = query.limit(limit + 1).all() if limit else query.all()
+        headers = {}
+        if limit and len(images) > limit:
+            images = images[:limit]
+            next_args = dict(request.args, after=images[-1].id)
+            headers["X-Next-Cursor"] = str(images[-1].id)
+            headers["Link"] = f'<{base_url}{request.path}?{urlencode(next_args)}>; rel="next"'
+        entries = [image_entry(img, base_url) for img in images]
+        if ndjson:
+            body = "".join(json.dumps(entry) + "\n" for entry in entries)
+            return Response(body, mimetype="application/x-ndjson", headers=headers)
+        return jsonify(entries), 200, headers
+
+    return response_cache.respond(user_id, (category, limit, after, ndjson), build,
+                                  store=not (ndjson and limit is None))
+
+
 # GETS THE CLOTHES BY CATEGORY
 @app.route("/images/<category>", methods=["GET"])
 def get_images_by_category(category):
-    images = ImageModel.query.filter_by(category=category).all()
-
-    image_list = [
-        {
-            "id": img.id,
-            "image_path": f"http://172.16.100.209:5000/uploads/{img.image_path}",
-            "category": img.category
-        }
-        for img in images
-    ]
-
-    return jsonify(image_list), 200
+    user_id = request.args.get("user_id")
+    if not user_id:
+        return jsonify({"error": "Missing user_id"}), 400
+    return list_images(user_id, category)
 
 # GETS ALL CLOTHINGS OF USER
 @app.route("/images/user/<user_id>", methods=["GET"])
 def get_user_images(user_id):
-    images = ImageModel.query.filter_by(user_id=user_id).all()
+    return list_images(user_id)
 
-    return jsonify([
-        {
-            "id": img.id,
-            "image_path": f"http://172.16.100.209:5000/uploads/{img.image_path}",
-            "category": img.category
-        }
-        for img in images
-    ])
+@app.route("/recommendation-status/<int:user_id>", methods=["GET"])
+def recommendation_status(user_id):
+    job = scheduler.status(user_id)
+    has_results = RecommendationResult.query.filter_by(user_id=user_id).first() is not None
+
+    if job is None:
+        return jsonify({"status": "idle", "progress": 1.0 if has_results else 0.0,
+                        "has_recommendations": has_results}), 200
+
+    response = job.to_dict()
+    response["has_recommendations"] = has_results
+    return jsonify(response), 200
 
-@app.route("/recommend", methods=["POST"])
+@app.route("/recommend", methods=["GET", "POST"])
 def recommend_outfit():
+    """
+    Same parameters as query arguments (GET) or JSON body (POST). Only GET requests can be
+    answered with 304 Not Modified; both are served from the response cache.
+    """
     try:
-        data = request.get_json()
+        data = request.args if request.method == "GET" else request.get_json()
         event = data.get("event")
         user_id = data.get("user_id")
         
         if not event or not user_id:
             return jsonify({"error": "Missing event or user ID"}), 400
 
-        threshold = 0.60  # 🔵 75% threshold
+        try:
+            threshold = float(data.get("threshold", DEFAULT_RECOMMEND_THRESHOLD))
+            limit = min(int(data.get("limit", DEFAULT_RECOMMEND_LIMIT)), MAX_RECOMMEND_LIMIT)
+            cursor = parse_recommend_cursor(data.get("cursor"))
+        except (TypeError, ValueError):
+            return jsonify({"error": "Invalid threshold, limit or cursor"}), 400
+        if limit < 1:
+            # SQLite reads a negative LIMIT as no limit, and limit=0 would skip the first row via its cursor
+            return jsonify({"error": "limit must be at least 1"}), 400
+
+        base_url = public_base_url()
+        return response_cache.respond(user_id, (event, threshold, limit, cursor),
+                                      lambda: recommendation_page(user_id, event, threshold, limit, cursor, base_url))
+
+    except Exception as e:
+        print(f"❌ Recommend API Error: {str(e)}")
+        return jsonify({"error": f"Internal Server Error: {str(e)}"}), 500
 
-        user_recommendations = RecommendationResult.query.filter_by(user_id=user_id).all()
 
-        if not user_recommendations:
+def recommendation_page(user_id, event, threshold, limit, cursor, base_url):
+    query = (db.session.query(RecommendationScore.score, RecommendationResult)
+             .join(RecommendationResult, RecommendationResult.id == RecommendationScore.result_id)
+             .filter(RecommendationScore.user_id == user_id,
+                     RecommendationScore.event == event,
+                     RecommendationScore.score >= threshold))
+    if cursor:
+        # Keyset paging: continue strictly after the last (score, id) of the previous page
+        last_score, last_id = cursor
+        query = query.filter(or_(RecommendationScore.score < last_score,
+                                 and_(RecommendationScore.score == last_score,
+                                      RecommendationScore.result_id > last_id)))
+    rows = (query.order_by(RecommendationScore.score.desc(), RecommendationScore.result_id)
+            .limit(limit + 1).all())
+
+    if not rows and not cursor:
+        if not RecommendationResult.query.filter_by(user_id=user_id).first():
             return jsonify({"error": "No recommendations found. Please upload images first."}), 404
+        return jsonify({"error": f"No outfits found for '{event}' above {threshold * 100:.0f}%"}), 404
+
+    filtered_outfits = []
+    for score, rec in rows[:limit]:
+        filenames = json.loads(rec.outfit)
+        image_urls = [f"{base_url}/uploads/{filename}" for filename in filenames]
+        filtered_outfits.append({
+            "match_score": score,
+            "outfit": image_urls,
+            "raw_filenames": filenames,
+            "scores": json.loads(rec.scores),
+            "heatmap_url": f"{base_url}/recommendations/{rec.id}/heatmap?user_id={user_id}"
+        })
 
-        filtered_outfits = []
-        for rec in user_recommendations:
-            event_scores = json.loads(rec.scores)
-            score = event_scores.get(event)
-            if score is not None and score >= threshold:
-                filenames = json.loads(rec.outfit)
-                image_urls = [f"http://172.16.100.209:5000/uploads/{filename}" for filename in filenames]
-                filtered_outfits.append({
-                    "match_score": score,
-                    "outfit": image_urls,
-                    "raw_filenames": filenames,
-                    "scores": event_scores
-                })
+    next_cursor = None
+    if len(rows) > limit:
+        last_score, last_rec = rows[limit - 1]
+        next_cursor = f"{last_score!r}:{last_rec.id}"
+
+    return jsonify({
+        "event": event,
+        "results": filtered_outfits,
+        "next_cursor": next_cursor
+    }), 200
+
+
+@app.route("/recommendations/<int:result_id>/heatmap", methods=["GET"])
+def recommendation_heatmap(result_id):
+    """
+    PNG of the attention between the images of one recommended outfit, rendered on first
+    request. Heatmaps only depend on the outfit and the model, so the ETag never goes stale.
+    """
+    user_id = request.args.get("user_id")
+    if not user_id:
+        return jsonify({"error": "Missing user_id"}), 400
+    rec = db.session.get(RecommendationResult, result_id)
+    if rec is None or str(rec.user_id) != str(user_id):
+        return jsonify({"error": "Recommendation not found"}), 404
+
+    try:
+        model = get_model()
+        outfit = json.loads(rec.outfit)
+        key = heatmap_key(model.version, outfit)
+        if key in request.if_none_match:
+            response = Response(status=304)
+        else:
+            data = heatmap_cache.get(key)
+            if data is None:
+                attention = outfit_attention(rec.user_id, outfit, model)
+                with STAGE_SECONDS.time(stage="heatmap_render"):
+                    data = render_attention(os.path.abspath(app.config["UPLOAD_FOLDER"]), outfit, attention)
+                heatmap_cache.put(key, data)
+            response = Response(data, mimetype="image/png")
+    except Exception as e:
+        print(f"❌ Heatmap Error: {str(e)}")
+        return jsonify({"error": f"Could not render heatmap: {str(e)}"}), 500
 
-        if not filtered_outfits:
-            return jsonify({"error": f"No outfits found for '{event}' above {threshold * 100:.0f}%"}), 404
+    response.set_etag(key)
+    response.cache_control.private = True
+    response.cache_control.max_age = app.config["UPLOAD_CACHE_SECONDS"]
+    return response
 
-        # Optional: sort results from highest to lowest
-        filtered_outfits.sort(key=lambda x: x["match_score"], reverse=True)
 
-        return jsonify({
-            "event": event,
-            "results": filtered_outfits
-        }), 200
+def parse_recommend_cursor(cursor):
+    """Cursor format is '<score>:<result id>' as returned in next_cursor."""
+    if not cursor:
+        return None
+    score, result_id = str(cursor).rsplit(":", 1)
+    return float(score), int(result_id)
 
-    except Exception as e:
-        print(f"❌ Recommend API Error: {str(e)}")
-        return jsonify({"error": f"Internal Server Error: {str(e)}"}), 500
+
+MAX_OUTFIT_BATCH = 500
+
+
+def save_outfits_for_user(user_id, entries):
+    """
+    Saves [(event, outfit paths), ...] for one user in one commit. Every filename is resolved
+    to its image id with a single indexed image_path IN (...) lookup.
+    Returns the new Saved rows.
+    """
+    filenames = {Saved.image_filename(path) for _, paths in entries for path in paths}
+    image_ids = dict(
+        db.session.query(ImageModel.image_path, ImageModel.id)
+        .filter(ImageModel.user_id == int(user_id), ImageModel.image_path.in_(filenames))
+        .all()
+    )
+
+    rows = []
+    for event, outfit_paths in entries:
+        clothes_ids = []
+        for path in outfit_paths:
+            image_id = image_ids.get(Saved.image_filename(path))
+            if image_id:
+                clothes_ids.append(image_id)
+            else:
+                print(f"⚠️ Image not found for {Saved.image_filename(path)}")
+        rows.append(Saved(user_id=user_id, event=event, outfit=outfit_paths, clothes_ids=clothes_ids,
+                          outfit_key=Saved.make_outfit_key(outfit_paths)))
+    db.session.add_all(rows)
+    User.bump_cache_version(user_id)
+    db.session.commit()
+
+    for row in rows:
+        fp_miner.saved(str(user_id), row.id, row.clothes_ids)
+    return rows
+
+
+def remove_outfits_for_user(user_id, entries):
+    """
+    Removes one saved outfit per (event, outfit paths) entry, matched on the indexed
+    (user_id, event, outfit_key). Returns the number of outfits removed.
+    """
+    keys = [(event, Saved.make_outfit_key(outfit_paths)) for event, outfit_paths in entries]
+    matches = (db.session.query(Saved.id, Saved.event, Saved.outfit_key)
+               .filter(Saved.user_id == str(user_id), tuple_(Saved.event, Saved.outfit_key).in_(set(keys)))
+               .order_by(Saved.id).all())
+    candidates = {}
+    for saved_id, event, key in matches:
+        candidates.setdefault((event, key), []).append(saved_id)
+    removed_ids = [candidates[key].pop(0) for key in keys if candidates.get(key)]
+    return remove_saved_by_ids(user_id, removed_ids)
+
+
+def remove_saved_by_ids(user_id, saved_ids):
+    if not saved_ids:
+        return 0
+    removed = Saved.query.filter(Saved.user_id == str(user_id), Saved.id.in_(saved_ids)).delete(synchronize_session=False)
+    User.bump_cache_version(user_id)
+    db.session.commit()
+    fp_miner.removed(str(user_id), saved_ids)
+    return removed
+
+
+def parse_outfit_entries(outfits):
+    """[{'event': ..., 'outfit': [paths]}, ...] -> [(event, paths), ...], or None if malformed."""
+    if not isinstance(outfits, list) or not 0 < len(outfits) <= MAX_OUTFIT_BATCH:
+        return None
+    entries = []
+    for item in outfits:
+        event = item.get('event') if isinstance(item, dict) else None
+        outfit_paths = item.get('outfit') if isinstance(item, dict) else None
+        if not event or not outfit_paths or not isinstance(outfit_paths, list):
+            return None
+        entries.append((event, outfit_paths))
+    return entries
 
 
 @app.route('/save_outfit', methods=['POST'])
@@ -364,30 +778,25 @@ def save_outfit():
     if not all([user_id, event, outfit_paths]):
         return jsonify({'error': 'Missing data'}), 400
 
-    # 🔵 Normalize path and get image_ids
-    image_ids = []
-    for path in outfit_paths:
-        # Extract filename only (e.g., '595eb00cfb374e0989e512f2894f0213_upload_0.jpg')
-        filename = path.split('/')[-1]
-        image_record = ImageModel.query.filter(
-            ImageModel.image_path.like(f"%{filename}"),
-            ImageModel.user_id == int(user_id)
-        ).first()
-        if image_record:
-            image_ids.append(image_record.id)
-        else:
-            print(f"⚠️ Image not found for {filename}")
+    saved = save_outfits_for_user(user_id, [(event, outfit_paths)])[0]
+    return jsonify({'message': 'Outfit saved successfully!', 'image_ids': saved.clothes_ids}), 201
 
-    new_saved = Saved(
-        user_id=user_id,
-        event=event,
-        outfit=outfit_paths,
-        clothes_ids=image_ids
-    )
-    db.session.add(new_saved)
-    db.session.commit()
 
-    return jsonify({'message': 'Outfit saved successfully!', 'image_ids': image_ids}), 201
+# SAVE MANY OUTFITS AT ONCE
+@app.route('/save_outfits', methods=['POST'])
+def save_outfits():
+    data = request.json
+    user_id = data.get('user_id')
+    entries = parse_outfit_entries(data.get('outfits'))
+
+    if not user_id or entries is None:
+        return jsonify({'error': f'Missing data, send user_id and 1 to {MAX_OUTFIT_BATCH} outfits with event and outfit'}), 400
+
+    saved = save_outfits_for_user(user_id, entries)
+    return jsonify({
+        'message': f'{len(saved)} outfits saved successfully!',
+        'saved': [{'id': row.id, 'event': row.event, 'image_ids': row.clothes_ids} for row in saved]
+    }), 201
 
 
 # REMOVE SAVE
@@ -401,18 +810,38 @@ def remove_outfit():
     if not all([user_id, event, outfit]):
         return jsonify({'error': 'Missing data'}), 400
 
-    # Find the outfit entry based on user_id, event, and outfit
-    saved_entry = Saved.query.filter_by(user_id=user_id, event=event, outfit=outfit).first()
-    if saved_entry:
-        db.session.delete(saved_entry)
-        db.session.commit()
+    if remove_outfits_for_user(user_id, [(event, outfit)]):
         return jsonify({'message': 'Outfit removed successfully!'}), 200
     else:
         return jsonify({'error': 'Outfit not found'}), 404
 
-from mlxtend.frequent_patterns import fpgrowth
-from mlxtend.preprocessing import TransactionEncoder
-import pandas as pd
+
+# REMOVE MANY SAVED OUTFITS AT ONCE, by outfit or by saved id
+@app.route('/remove_outfits', methods=['POST'])
+def remove_outfits():
+    data = request.json
+    user_id = data.get('user_id')
+    ids = data.get('ids')
+
+    if not user_id or (ids is None and data.get('outfits') is None):
+        return jsonify({'error': 'Missing data, send user_id and outfits or ids'}), 400
+
+    removed = 0
+    if ids is not None:
+        try:
+            ids = [int(saved_id) for saved_id in ids]
+        except (TypeError, ValueError):
+            ids = None
+        if ids is None or len(ids) > MAX_OUTFIT_BATCH:
+            return jsonify({'error': f'ids must be a list of at most {MAX_OUTFIT_BATCH} saved outfit ids'}), 400
+        removed += remove_saved_by_ids(user_id, ids)
+    if data.get('outfits') is not None:
+        entries = parse_outfit_entries(data.get('outfits'))
+        if entries is None:
+            return jsonify({'error': f'outfits must be 1 to {MAX_OUTFIT_BATCH} items with event and outfit'}), 400
+        removed += remove_outfits_for_user(user_id, entries)
+
+    return jsonify({'message': f'{removed} outfits removed', 'removed': removed}), 200
 
 @app.route('/fp_growth_saved', methods=['GET'])
 def fp_growth_saved():
@@ -421,38 +850,23 @@ def fp_growth_saved():
     if not user_id:
         return jsonify({'error': 'Missing user_id'}), 400
 
-    saved_outfits = Saved.query.filter_by(user_id=user_id).all()
-    transactions = []
-    item_details = {}
-
-    for saved in saved_outfits:
-        clothing_ids = []
-        for image_id in saved.clothes_ids:
-            image = ImageModel.query.filter_by(id=image_id, user_id=int(user_id)).first()
-            if image:
-                clothing_ids.append(image.id)
-                item_details[image.id] = {
-                    "id": image.id,
-                    "image_path": image.image_path
-                }
-        if clothing_ids:
-            transactions.append(clothing_ids)
-
+    try:
+        min_support = float(request.args.get('min_support', DEFAULT_MIN_SUPPORT))
+    except ValueError:
+        return jsonify({'error': 'min_support must be a number'}), 400
+    if not 0 < min_support <= 1:
+        return jsonify({'error': 'min_support must be greater than 0 and at most 1'}), 400
+
+    # Per-user FP-tree, kept up to date incrementally; results are cached until it changes
+    transactions, itemsets, images = fp_miner.frequent_itemsets(str(user_id), min_support)
     if not transactions:
         return jsonify({'error': 'No transactions available for this user'}), 404
 
-    te = TransactionEncoder()
-    te_ary = te.fit(transactions).transform(transactions)
-    df = pd.DataFrame(te_ary, columns=te.columns_)
-
-    frequent_itemsets = fpgrowth(df, min_support=0.3, use_colnames=True)
-
     result = []
-    for row in frequent_itemsets.to_dict(orient='records'):
-        items = [item_details[i] for i in row['itemsets']]
+    for items, support in itemsets:
         result.append({
-            'itemsets': items,
-            'support': row['support']
+            'itemsets': [{"id": image_id, "image_path": images[image_id]} for image_id in items],
+            'support': support
         })
     return jsonify({'frequent_itemsets': result})
 
@@ -464,6 +878,10 @@ def get_saved_outfits():
     if not user_id:
         return jsonify({'error': 'Missing user_id'}), 400
 
+    return response_cache.respond(user_id, None, lambda: saved_outfits_for_user(user_id))
+
+
+def saved_outfits_for_user(user_id):
     saved_outfits = Saved.query.filter_by(user_id=user_id).all()
     if not saved_outfits:
         return jsonify({'saved_outfits': []}), 200
@@ -494,7 +912,6 @@ def remove_outfit_by_id():
         return jsonify({'error': 'Saved outfit not found'}), 404
 
     # Delete from DB
-    db.session.delete(saved_outfit)
-    db.session.commit()
+    remove_saved_by_ids(saved_outfit.user_id, [saved_outfit.id])
 
     return jsonify({'message': 'Saved outfit removed successfully'}), 200
\ No newline at end of file
@@ -0,0 +1,164 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+from flask import g, request, Response
+
+# Upper bounds in seconds: sub-millisecond lookups up to a cold rembg or a full scoring run
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Histogram:
+    """
+    Prometheus histogram kept in process memory.
+    - observe(seconds, **labels) or `with histogram.time(**labels):`
+    - Every label in labelnames must be given on each observation
+    """
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._lock = threading.Lock()
+        self._series = {}  # label values -> [per-bucket counts, sum, count]
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def collect(self, const_labels):
+        names = tuple(const_labels) + self.labelnames
+        with self._lock:
+            series = [(key, list(counts), total, count) for key, (counts, total, count) in self._series.items()]
+
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, counts, total, count in sorted(series):
+            values = tuple(const_labels.values()) + key
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(names + ("le",), values + (_format_value(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(names, values)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(names, values)} {count}")
+        return lines
+
+
+class Gauge:
+    """Gauge read from a callback at scrape time, e.g. a queue length."""
+
+    def __init__(self, name, documentation, callback):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+
+    def collect(self, const_labels):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        try:
+            value = self.callback()
+        except Exception as e:
+            print(f"❌ Could not read metric {self.name}: {e}")
+            return lines
+        names = tuple(const_labels)
+        lines.append(f"{self.name}{_format_labels(names, tuple(const_labels.values()))} {_format_value(value)}")
+        return lines
+
+
+class Metrics:
+    """
+    Registry behind the /metrics endpoint (Prometheus text format).
+    - Per-route request latency is recorded by before/after request hooks
+    - Numbers are per process: under gunicorn every series carries a pid label, so the
+      workers a scrape happens to reach never overwrite each other's series
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._metrics = []
+        if app is not None:
+            self.init_app(app)
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, callback):
+        return self.register(Gauge(name, documentation, callback))
+
+    def init_app(self, app):
+        self.app = app
+        app.before_request(self._start_timer)
+        app.after_request(self._record_request)
+
+    @staticmethod
+    def _start_timer():
+        g.request_start = time.perf_counter()
+
+    @staticmethod
+    def _record_request(response):
+        start = g.pop("request_start", None)
+        if start is not None:
+            # The URL rule, not the path, keeps the number of series bounded (/images/<category>)
+            route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+            REQUEST_SECONDS.observe(time.perf_counter() - start, method=request.method,
+                                    route=route, status=response.status_code)
+        return response
+
+    def render(self):
+        const_labels = {"pid": os.getpid()}
+        lines = []
+        for metric in self._metrics:
+            lines += metric.collect(const_labels)
+        return "\n".join(lines) + "\n"
+
+    def response(self):
+        return Response(self.render(), content_type=CONTENT_TYPE)
+
+
+metrics = Metrics()
+
+REQUEST_SECONDS = metrics.histogram(
+    "morphfit_http_request_duration_seconds", "Flask request latency by route.", ("method", "route", "status"))
+STAGE_SECONDS = metrics.histogram(
+    "morphfit_stage_duration_seconds",
+    "Time spent in one hot-path stage (image decode, transform, backbone/head forward, DB writes, "
+    "rembg, FP-growth, ...).", ("stage",))
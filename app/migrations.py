@@ -0,0 +1,141 @@
+import json
+import sqlite3
+
+from app.database import db, Saved
+
+# Schema changes for databases created before a model changed. db.create_all() only creates
+# missing tables, so anything that alters an existing table or backfills data goes here.
+# Every step must be safe on a fresh database that create_all() just built.
+# The applied version is kept in SQLite's PRAGMA user_version.
+
+
+def _add_column(cur, table, column, ddl):
+    columns = {row[1] for row in cur.execute(f"PRAGMA table_info({table})")}
+    if column not in columns:
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+
+
+def backfill_recommendation_scores(cur):
+    # Results written before recommendation_score existed only have the JSON scores column
+    cur.execute("""
+        INSERT INTO recommendation_score (result_id, event, user_id, score)
+        SELECT r.id, j.key, r.user_id, j.value
+        FROM recommendation_result r, json_each(r.scores) j
+        WHERE NOT EXISTS (SELECT 1 FROM recommendation_score s WHERE s.result_id = r.id)
+    """)
+
+
+def add_lookup_indexes(cur):
+    cur.execute("CREATE INDEX IF NOT EXISTS ix_image_model_user_category ON image_model (user_id, category)")
+    cur.execute("CREATE INDEX IF NOT EXISTS ix_image_model_category ON image_model (category)")
+    cur.execute("CREATE INDEX IF NOT EXISTS ix_recommendation_result_user ON recommendation_result (user_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS ix_saved_user_event ON saved (user_id, event)")
+    cur.execute("CREATE INDEX IF NOT EXISTS ix_recommendation_job_user_status ON recommendation_job (user_id, status)")
+
+
+def add_image_processing_state(cur):
+    # Images uploaded before background removal moved off the request are already processed
+    _add_column(cur, "image_model", "status", "VARCHAR(20) NOT NULL DEFAULT 'ready'")
+    _add_column(cur, "image_model", "error", "TEXT")
+
+
+def add_saved_outfit_keys(cur):
+    # Saved outfits and images are looked up by filename with indexed equality instead of LIKE
+    _add_column(cur, "saved", "outfit_key", "VARCHAR(1000)")
+    rows = cur.execute("SELECT id, outfit FROM saved WHERE outfit_key IS NULL").fetchall()
+    cur.executemany("UPDATE saved SET outfit_key = ? WHERE id = ?",
+                    [(Saved.make_outfit_key(json.loads(outfit)), saved_id) for saved_id, outfit in rows])
+    cur.execute("CREATE INDEX IF NOT EXISTS ix_saved_user_event_outfit_key ON saved (user_id, event, outfit_key)")
+    cur.execute("CREATE INDEX IF NOT EXISTS ix_image_model_user_path ON image_model (user_id, image_path)")
+
+
+def add_user_cache_version(cur):
+    _add_column(cur, "user", "cache_version", "INTEGER NOT NULL DEFAULT 0")
+
+
+def add_image_keyset_indexes(cur):
+    cur.execute("CREATE INDEX IF NOT EXISTS ix_image_model_user_id_key ON image_model (user_id, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS ix_image_model_user_category_id ON image_model (user_id, category, id)")
+
+
+
+def add_image_hashes(cur):
+    # Images uploaded before this have no hashes and are never matched as duplicates
+    _add_column(cur, "image_model", "content_hash", "VARCHAR(64)")
+    _add_column(cur, "image_model", "phash", "VARCHAR(16)")
+    cur.execute("CREATE INDEX IF NOT EXISTS ix_image_model_user_content_hash ON image_model (user_id, content_hash)")
+
+
+def add_unique_pending_job_index(cur):
+    # Concurrent enqueues could leave several pending jobs per user: fold them into the oldest
+    rows = cur.execute("""
+        SELECT id, user_id, full_rebuild, new_image_paths FROM recommendation_job
+        WHERE status = 'pending' ORDER BY id
+    """).fetchall()
+    kept = {}
+    for job_id, user_id, full_rebuild, new_image_paths in rows:
+        if user_id not in kept:
+            kept[user_id] = [job_id, bool(full_rebuild), set(json.loads(new_image_paths))]
+            continue
+        merged = kept[user_id]
+        merged[1] = merged[1] or bool(full_rebuild)
+        merged[2] |= set(json.loads(new_image_paths))
+        cur.execute("DELETE FROM recommendation_job WHERE id = ?", (job_id,))
+    cur.executemany("UPDATE recommendation_job SET full_rebuild = ?, new_image_paths = ? WHERE id = ?",
+                    [(full_rebuild, json.dumps([] if full_rebuild else sorted(paths)), job_id)
+                     for job_id, full_rebuild, paths in kept.values()])
+    cur.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS ux_recommendation_job_user_pending
+        ON recommendation_job (user_id) WHERE status = 'pending'
+    """)
+
+
+def narrow_recommendation_result_index(cur):
+    # Databases that applied migration 2 before it was narrowed still have the (user_id, event) index
+    cur.execute("DROP INDEX IF EXISTS ix_recommendation_result_user_event")
+    cur.execute("CREATE INDEX IF NOT EXISTS ix_recommendation_result_user ON recommendation_result (user_id)")
+
+
+MIGRATIONS = [
+    (1, "backfill recommendation_score", backfill_recommendation_scores),
+    (2, "indexes for per-user lookups", add_lookup_indexes),
+    (3, "image_model processing status", add_image_processing_state),
+    (4, "saved outfit keys and image path index", add_saved_outfit_keys),
+    (5, "user cache version", add_user_cache_version),
+    (6, "image listing keyset indexes", add_image_keyset_indexes),
+    (7, "image content and perceptual hashes", add_image_hashes),
+    (8, "one pending recommendation job per user", add_unique_pending_job_index),
+    (9, "recommendation_result user index without event", narrow_recommendation_result_index),
+]
+
+
+def run_migrations():
+    """Applies pending migrations in order, each in its own write transaction."""
+    raw = db.engine.raw_connection()
+    try:
+        conn = raw.driver_connection
+        previous_isolation = conn.isolation_level
+        conn.isolation_level = None  # we issue BEGIN/COMMIT ourselves
+        cur = conn.cursor()
+        try:
+            for version, description, migrate in MIGRATIONS:
+                # BEGIN IMMEDIATE takes the write lock before reading the version, so
+                # several workers starting at once apply each step only once
+                cur.execute("BEGIN IMMEDIATE")
+                try:
+                    current = cur.execute("PRAGMA user_version").fetchone()[0]
+                    if current >= version:
+                        cur.execute("COMMIT")
+                        continue
+                    migrate(cur)
+                    cur.execute(f"PRAGMA user_version = {version}")
+                    cur.execute("COMMIT")
+                    print(f"🛠️ Applied migration {version}: {description}")
+                except sqlite3.Error:
+                    cur.execute("ROLLBACK")
+                    raise
+        finally:
+            cur.close()
+            conn.isolation_level = previous_isolation
+    finally:
+        raw.close()
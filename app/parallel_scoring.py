@@ -0,0 +1,163 @@
+import os
+import time
+import multiprocessing
+from collections import deque, namedtuple
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from app.pruning import OutfitIndex
+
+# Shards are whole scoring chunks: up to this many per shard, and enough shards for every
+# worker to get several, so a slow shard does not leave the other workers idle at the end
+MAX_SHARD_CHUNKS = 16
+SHARDS_PER_WORKER = 4
+
+# Set once per pool process by _init_worker
+_backend = None
+
+# One finished shard: the outfits that can still reach a top K with their probabilities and
+# positions, how many outfits the shard scored, the position of its last one and the head time per chunk
+ShardResult = namedtuple("ShardResult", ["outfits", "probs", "positions", "scored", "last_position", "timings"])
+
+
+def _init_worker(weights_path, weights_version, backend_name, export_dir, threads):
+    global _backend
+    import torch
+    from app.siamese_network import SiameseNetwork
+    from app.inference import create_backend
+
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(1)
+    network = SiameseNetwork(pretrained=False)
+    # mmap: tensors the worker drops are never read into memory
+    state = torch.load(weights_path, map_location="cpu", weights_only=False, mmap=True)
+    if backend_name == "torch":
+        # Workers only run the head: leave the backbone (most of the weights) in the parent
+        network.base_cnn = None
+        state = {name: value for name, value in state.items() if not name.startswith("base_cnn.")}
+    network.load_state_dict(state)
+    del state
+    network.eval()
+    network.version = weights_version  # finds the parent's ONNX export instead of exporting again
+    _backend = create_backend(network, backend_name, export_dir=export_dir, threads=threads)
+
+
+def _score_shard(vectors, index, seqs, top_k, chunk_size):
+    """
+    Runs in a pool process: full-head scores of one shard, chunk by chunk.
+    - vectors: embeddings of the wardrobe plus the blank image as the last row
+    - index: (M, 7) rows of vectors per outfit; seqs: their enumeration positions
+    Returns the shard rows in the top_k of any event (by score, then earlier seq),
+    their probabilities and the head time per chunk.
+    """
+    timings = []
+    probs = None
+    for start in range(0, len(index), chunk_size):
+        batch = vectors[index[start:start + chunk_size]]
+        begin = time.perf_counter()
+        logits, _ = _backend.score_embeddings(batch)
+        timings.append(time.perf_counter() - begin)
+        if probs is None:
+            probs = np.empty((len(index), logits.shape[1]), dtype=logits.dtype)
+        probs[start:start + len(batch)] = 1.0 / (1.0 + np.exp(-logits))
+
+    keep = set()
+    for column in probs.T:
+        keep.update(np.lexsort((seqs, -column))[:top_k].tolist())
+    rows = np.array(sorted(keep), dtype=np.int64)
+    return rows, probs[rows], timings
+
+
+class ScoringPool:
+    """
+    Full-head scoring of large outfit spaces on a process pool, one torch runtime per worker.
+    - The candidates are cut into shards of whole scoring chunks, so every outfit is scored in
+      the same batch as on the sequential path and gets bit-for-bit the same probabilities
+    - Workers only send back the outfits in the top K of their shard for some event; the caller
+      merges them by (score, -seq), which gives the sequential result at any worker count
+    - Each worker runs torch with RECOMMENDATION_SCORING_THREADS threads (default: cores / workers)
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._executor = None
+        self._executor_key = None
+        self.workers = 0
+        self.threads = 1
+        self.export_dir = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.workers = app.config.get("RECOMMENDATION_SCORING_WORKERS", 0)
+        self.threads = app.config.get("RECOMMENDATION_SCORING_THREADS", 0) or self.default_threads(self.workers)
+        self.export_dir = app.config.get("ONNX_EXPORT_DIR")
+
+    @staticmethod
+    def default_threads(workers):
+        return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+    def _pool(self, model, weights_path):
+        key = (weights_path, model.weights_version, model.name, self.workers, self.threads)
+        if self._executor is not None and self._executor_key != key:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        if self._executor is None:
+            # spawn, not fork: the parent already runs torch threads
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(weights_path, model.weights_version, model.name, self.export_dir, self.threads),
+            )
+            self._executor_key = key
+            # Processes are spawned on demand: one task each starts them all and waits for the model loads
+            for future in [self._executor.submit(os.getpid) for _ in range(self.workers)]:
+                future.result()
+            print(f"🧵 Started {self.workers} scoring processes with {self.threads} threads each")
+        return self._executor
+
+    def score(self, model, weights_path, candidates, embeddings, blank_embedding, top_k, chunk_size, total):
+        """
+        Scores (position, outfit) candidates and yields a ShardResult per shard, in enumeration order.
+        - weights_path: checkpoint the workers load, the one model was built from
+        - total: expected number of candidates, sizes the shards
+        """
+        image_paths = list(embeddings)
+        index = OutfitIndex(image_paths)
+        vectors = np.stack([embeddings[p] for p in image_paths] + [blank_embedding]).astype(np.float32)
+        shard_chunks = -(-total // (chunk_size * self.workers * SHARDS_PER_WORKER))
+        shard_size = chunk_size * max(1, min(MAX_SHARD_CHUNKS, shard_chunks))
+
+        pool = self._pool(model, weights_path)
+        pending = deque()
+        try:
+            candidates = iter(candidates)
+            while True:
+                shard = list(islice(candidates, shard_size))
+                if shard:
+                    positions = np.array([position for position, _ in shard], dtype=np.int64)
+                    outfits = [outfit for _, outfit in shard]
+                    future = pool.submit(_score_shard, vectors, index(outfits), positions, top_k, chunk_size)
+                    pending.append((future, outfits, positions))
+                # Keep every worker busy with a bounded number of shards in memory
+                while pending and (len(pending) > 2 * self.workers or not shard):
+                    future, outfits, positions = pending.popleft()
+                    rows, probs, timings = future.result()
+                    yield ShardResult([outfits[row] for row in rows], probs, positions[rows],
+                                      len(outfits), int(positions[-1]), timings)
+                if not shard:
+                    return
+        except BrokenProcessPool:
+            self._executor = None
+            raise
+        finally:
+            for future, _, _ in pending:
+                future.cancel()
+
+
+scoring_pool = ScoringPool()
@@ -0,0 +1,131 @@
+import numpy as np
+
+from app.metrics import STAGE_SECONDS
+
+# Cheap first-stage scorers: the full head only sees the outfits they rank best
+PRUNE_SCORERS = ("head", "cosine")
+MAX_SLOTS = 7
+
+
+class OutfitIndex:
+    """Maps outfits (tuples of image paths) to rows of per-image tables, padded to 7 slots."""
+
+    def __init__(self, image_paths):
+        self.rows = {image_path: row for row, image_path in enumerate(image_paths)}
+        self.pad = len(self.rows)
+
+    def __call__(self, outfits):
+        index = np.full((len(outfits), MAX_SLOTS), self.pad, dtype=np.int64)
+        for row, outfit in enumerate(outfits):
+            index[row, :len(outfit)] = [self.rows[image_path] for image_path in outfit]
+        return index
+
+
+class AdditiveHeadScorer:
+    """
+    One score per event: the logits of the backend's AdditiveHead, built from a table of
+    per-(image, slot) contributions so an outfit costs 7 lookups instead of a head pass.
+    """
+
+    def __init__(self, additive_head, embeddings, blank_embedding):
+        image_paths = list(embeddings)
+        self.index = OutfitIndex(image_paths)
+        vectors = np.stack([embeddings[p] for p in image_paths] + [blank_embedding])
+        self.table = additive_head.contributions(vectors)  # (images + blank, 7, 13)
+        self.bias = additive_head.bias
+
+    def score(self, outfits):
+        index = self.index(outfits)
+        return self.bias + self.table[index, np.arange(MAX_SLOTS)].sum(axis=1)
+
+
+class CosineScorer:
+    """
+    One event-agnostic score: the mean pairwise cosine similarity of the outfit's images.
+    """
+
+    def __init__(self, embeddings):
+        image_paths = list(embeddings)
+        self.index = OutfitIndex(image_paths)
+        vectors = np.stack([embeddings[p] for p in image_paths])
+        vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        # The padding row and column are zero, so empty slots add nothing to the sum
+        self.similarity = np.zeros((len(image_paths) + 1, len(image_paths) + 1), dtype=np.float32)
+        self.similarity[:-1, :-1] = vectors @ vectors.T
+
+    def score(self, outfits):
+        index = self.index(outfits)
+        total = np.zeros(len(outfits), dtype=np.float32)
+        for i in range(MAX_SLOTS):
+            for j in range(i + 1, MAX_SLOTS):
+                total += self.similarity[index[:, i], index[:, j]]
+        sizes = np.array([len(outfit) for outfit in outfits], dtype=np.float32)
+        return (total / np.maximum(sizes * (sizes - 1) / 2, 1))[:, np.newaxis]
+
+
+def create_scorer(name, model, embeddings, blank_embedding):
+    """
+    - name: one of PRUNE_SCORERS
+    - embeddings: {image_path: 2048-d embedding} for every image the outfits use
+    """
+    if name == "head":
+        return AdditiveHeadScorer(model.additive_head, embeddings, blank_embedding)
+    if name == "cosine":
+        return CosineScorer(embeddings)
+    raise ValueError(f"Unknown prune scorer {name!r}, expected one of {', '.join(PRUNE_SCORERS)}")
+
+
+def candidate_budget(total, prune_ratio, top_k):
+    """How many outfits the full head may score (a hard cap): prune_ratio of them, never fewer than top_k."""
+    return min(total, max(top_k, int(np.ceil(prune_ratio * total))))
+
+
+def _fill_budget(ranked_seqs, budget):
+    """
+    The first budget distinct seqs taken depth by depth: every column's best, then every
+    column's second best, and so on. ranked_seqs: (depth, columns), best first per column.
+    """
+    flat = ranked_seqs.ravel()  # row-major: depth by depth
+    seqs, first = np.unique(flat, return_index=True)
+    return seqs[np.argsort(first, kind="stable")[:budget]]
+
+
+def select_candidates(make_chunks, scorer, budget):
+    """
+    Yields (seq, outfit) for the outfits the full head should score, in enumeration order.
+    The columns of the cheap scores (one per event for "head") take turns contributing
+    their next best outfit until budget distinct outfits are chosen, so the full head never
+    scores more than budget; every event gets as deep as the budget allows.
+    Two passes over the same deterministic enumeration keep memory bounded by the budget.
+    - make_chunks: callable returning a fresh iterator over lists of outfits
+    """
+    best_scores = best_seqs = None
+    seq = 0
+    for batch in make_chunks():
+        with STAGE_SECONDS.time(stage="prune"):
+            scores = scorer.score(batch)
+            seqs = np.broadcast_to(np.arange(seq, seq + len(batch))[:, np.newaxis], scores.shape)
+            if best_scores is None:
+                best_scores, best_seqs = scores, seqs
+            else:
+                best_scores = np.concatenate([best_scores, scores])
+                best_seqs = np.concatenate([best_seqs, seqs])
+            if len(best_scores) > 2 * budget:
+                top = np.argpartition(-best_scores, budget - 1, axis=0)[:budget]
+                best_scores = np.take_along_axis(best_scores, top, axis=0)
+                best_seqs = np.take_along_axis(best_seqs, top, axis=0)
+        seq += len(batch)
+    if best_scores is None:
+        return
+
+    # Best first per column, earlier outfits first on ties (as in TopOutfits)
+    order = np.lexsort((best_seqs, -best_scores), axis=0)
+    ranked_seqs = np.take_along_axis(best_seqs, order, axis=0)
+    selected = set(_fill_budget(ranked_seqs, budget).tolist())
+
+    seq = 0
+    for batch in make_chunks():
+        for row, outfit in enumerate(batch):
+            if seq + row in selected:
+                yield seq + row, outfit
+        seq += len(batch)
@@ -1,25 +1,75 @@
 import os
 import json
-import torch
-from itertools import product
+import hashlib
+import heapq
+import time
+import threading
+import numpy as np
+from collections import namedtuple
+from functools import partial
+from itertools import product, islice
+from flask import current_app
+from sqlalchemy import insert
 from PIL import Image
-from torchvision import transforms
-from flask_sqlalchemy import SQLAlchemy
-from app.siamese_network import SiameseNetwork
-from app.database import db, ImageModel, RecommendationResult
-import gdown
+from app.database import db, User, ImageModel, RecommendationResult, RecommendationScore
+from app.embedding_store import EmbeddingStore, EMBEDDING_DIM
+from app.tensor_store import TensorStore
+from app.metrics import STAGE_SECONDS
+from app.pruning import create_scorer, candidate_budget, select_candidates
+from app.parallel_scoring import scoring_pool
+
+# torch, torchvision and the network are imported by load_model/get_model, so importing
+# this module (and app.main) stays cheap until the model is actually needed
 
 model = None  # ✅ Lazy-load model only when needed
+network = None  # the SiameseNetwork the backend wraps, loaded first (and alone in the gunicorn master)
+_model_lock = threading.Lock()
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+UPLOAD_DIR = os.path.abspath(os.environ.get("UPLOAD_FOLDER", os.path.join(BASE_DIR, "uploads")))
+
+MODEL_PATH = os.environ.get("MODEL_PATH", os.path.join(BASE_DIR, "app", "siamese_model.pt"))
+MODEL_URL = os.environ.get("MODEL_URL", "https://drive.google.com/uc?export=download&id=1KoyusogBnMQEtqAaY2JvlbaV1vRbHMql")
+
+embedding_store = EmbeddingStore(
+    root=os.environ.get("EMBEDDING_CACHE_DIR", os.path.join(BASE_DIR, "assets", "embeddings")),
+    max_items=int(os.environ.get("EMBEDDING_CACHE_MAX_ITEMS", 5000)),
+)
+tensor_store = TensorStore(
+    root=os.environ.get("TENSOR_STORE_DIR", os.path.join(BASE_DIR, "assets", "tensors")),
+)
+_blank_tensor = None
+_blank_embeddings = {}  # model version -> embedding of the white padding image
+
+WardrobeItem = namedtuple("WardrobeItem", ["image_path", "category"])
+
+DEFAULT_TOP_K = 50
+DEFAULT_MEMORY_BUDGET_MB = 256
+DEFAULT_WRITE_CHUNK = 500
+DEFAULT_PRUNE_RATIO = 1.0  # score every outfit with the full head
+DEFAULT_PRUNE_SCORER = "head"
+ENCODE_BATCH_SIZE = 16
+# Below this many outfits the scoring processes cost more than they save
+SHARDED_SCORING_MIN_OUTFITS = 20000
+# Rough peak activation size of the attention head for one outfit (~12 copies of 7x2048 floats)
+HEAD_BYTES_PER_OUTFIT = 12 * 7 * EMBEDDING_DIM * 4
 
-def download_model():
-    model_path = "app/siamese_model.pt"
-    model_url = "https://drive.google.com/uc?export=download&id=1KoyusogBnMQEtqAaY2JvlbaV1vRbHMql"
+EVENT_LABELS = ["Job Interviews", "Birthday", "Graduations", "MET Gala", "Business Meeting",
+                "Beach", "Picnic", "Summer", "Funeral", "Romantic Dinner", "Cold", "Casual", "Wedding"]
 
+def download_model(model_path=MODEL_PATH, model_url=MODEL_URL):
+    """
+    Fetches the Siamese weights from Google Drive if they are not on disk yet.
+    Returns model_path, or None when the file is missing and could not be downloaded.
+    """
     if not os.path.exists(model_path):
         print("🔽 Downloading Siamese model from Google Drive...")
         try:
             import gdown
-            gdown.download(model_url, model_path, quiet=False)
+            tmp_path = f"{model_path}.{os.getpid()}.tmp"
+            if not gdown.download(model_url, tmp_path, quiet=False):
+                raise RuntimeError("download returned nothing")
+            os.replace(tmp_path, model_path)
             print("✅ Model downloaded successfully.")
         except Exception as e:
             print(f"❌ Failed to download model: {e}")
@@ -30,34 +80,207 @@ def download_model():
 
 
 def load_model():
+    import torch
+    from app.siamese_network import SiameseNetwork
+
     model_path = download_model()
     device = torch.device("cpu")
     if not model_path or not os.path.exists(model_path):
-        raise FileNotFoundError(f"Siamese model not found at {model_path}")
+        raise FileNotFoundError(f"Siamese model not found at {MODEL_PATH}")
 
-    model = SiameseNetwork().to(device)
+    # No ImageNet weights: every parameter is overwritten by the checkpoint
+    model = SiameseNetwork(pretrained=False).to(device)
     model.load_state_dict(torch.load(model_path, map_location=device, weights_only=False))
     model.eval()
+    model.version = model_file_version(model_path)
     return model
 
-transform = transforms.Compose([
-    transforms.Resize((224, 224)),
-    transforms.ToTensor(),
-])
 
-def create_blank_image_tensor():
-    blank_image = Image.new("RGB", (224, 224), (255, 255, 255))
-    return transform(blank_image).unsqueeze(0)
+def model_file_version(model_path):
+    # Cached embeddings are keyed by this, so new weights never reuse stale vectors
+    sha = hashlib.sha256()
+    with open(model_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(chunk)
+    return sha.hexdigest()[:16]
+
 
+def get_network():
+    """
+    The loaded SiameseNetwork, without an inference backend: plain torch weights, no runtime
+    thread pools or sessions, so it is safe to load before forking.
+    """
+    global network
+    if network is None:
+        with _model_lock:
+            if network is None:
+                network = load_model()
+    return network
 
-def generate_recommendations(user_id):
+
+def get_model():
+    """The loaded network wrapped in the inference backend chosen by INFERENCE_BACKEND."""
     global model
     if model is None:
-        model = load_model()  # ✅ Lazy-load the model
+        loaded = get_network()
+        with _model_lock:  # warm-up and the first job may ask at the same time
+            if model is None:
+                from app.inference import create_backend
+
+                backend = create_backend(  # ✅ Lazy-load the model
+                    loaded,
+                    current_app.config.get("INFERENCE_BACKEND", "torch"),
+                    export_dir=current_app.config.get("ONNX_EXPORT_DIR", os.path.join(BASE_DIR, "assets", "onnx")),
+                    threads=current_app.config.get("INFERENCE_THREADS", 0),
+                )
+                print(f"🧠 Using {backend.name} inference backend")
+                model = backend
+    return model
 
-    print(f"🔄 Generating recommendations for user: {user_id}")
 
-    user_images = ImageModel.query.filter_by(user_id=user_id).all()
+def get_loaded_model():
+    """The backend if it is loaded already, None otherwise (never triggers a load)."""
+    return model
+
+
+def get_loaded_network():
+    """The network if it is loaded already (e.g. preloaded by the gunicorn master), None otherwise."""
+    return network
+
+
+def warm_up():
+    """Loads the model and runs one encoder pass so the first real request does not pay for it."""
+    get_blank_embedding(get_model())
+    return model
+
+
+def transform(img):
+    """
+    PIL RGB image -> (3, 224, 224) float32 array in [0, 1].
+    Same values as torchvision Compose([Resize((224, 224)), ToTensor()]), without importing torchvision.
+    """
+    array = np.asarray(img.resize((224, 224), Image.BILINEAR), dtype=np.float32) / 255.0
+    return array.transpose(2, 0, 1)
+
+
+def create_blank_image_tensor():
+    global _blank_tensor
+    if _blank_tensor is None:
+        blank_image = Image.new("RGB", (224, 224), (255, 255, 255))
+        _blank_tensor = transform(blank_image)[np.newaxis]
+    return _blank_tensor
+
+
+def _encode(model, image_tensor):
+    with STAGE_SECONDS.time(stage="backbone_forward"):
+        return model.encode(image_tensor)[0]
+
+
+def get_blank_embedding(model):
+    if model.version not in _blank_embeddings:
+        _blank_embeddings[model.version] = _encode(model, create_blank_image_tensor())
+    return _blank_embeddings[model.version]
+
+
+def preprocess_images(user_id, image_paths):
+    """
+    Returns {image_path: 3x224x224 view} from the user's tensor store, decoding and
+    resizing only the images that were never preprocessed.
+    """
+    tensors = tensor_store.get_many(user_id, image_paths)
+    missing = [p for p in image_paths if p not in tensors]
+    if missing:
+        fresh = {}
+        for image_path in missing:
+            with STAGE_SECONDS.time(stage="image_decode"):
+                with Image.open(os.path.join(UPLOAD_DIR, image_path)) as img:
+                    rgb = img.convert("RGB")
+            with STAGE_SECONDS.time(stage="transform"):
+                fresh[image_path] = transform(rgb)
+        tensor_store.put_many(user_id, fresh)
+        tensors.update(tensor_store.get_many(user_id, missing))
+    return tensors
+
+
+def get_embeddings(user_id, image_paths, model=None):
+    """
+    Returns {image_path: 2048-d embedding}, running the backbone only for images
+    that are not in the embedding store yet, in batches read from the tensor store.
+    """
+    model = model or get_model()
+    image_paths = list(dict.fromkeys(image_paths))
+    embeddings = {}
+    missing = []
+    for image_path in image_paths:
+        vector = embedding_store.get(image_path, model.version)
+        if vector is None:
+            missing.append(image_path)
+        else:
+            embeddings[image_path] = vector
+
+    if missing:
+        tensors = preprocess_images(user_id, missing)
+        for start in range(0, len(missing), ENCODE_BATCH_SIZE):
+            batch_paths = missing[start:start + ENCODE_BATCH_SIZE]
+            batch = np.stack([tensors[p] for p in batch_paths])
+            with STAGE_SECONDS.time(stage="backbone_forward"):
+                vectors = model.encode(batch)
+            for image_path, vector in zip(batch_paths, vectors):
+                embedding_store.put(image_path, model.version, vector)
+                embeddings[image_path] = vector
+    return embeddings
+
+
+def cache_embeddings(user_id, image_paths):
+    """Preprocesses freshly uploaded images and fills the embedding store."""
+    get_embeddings(user_id, image_paths)
+    print(f"📦 Cached embeddings for {len(image_paths)} images")
+
+
+def invalidate_images(removed):
+    """Drops cached tensors and embeddings of deleted images, given (user_id, image_path) pairs."""
+    by_user = {}
+    for user_id, image_path in removed:
+        by_user.setdefault(user_id, []).append(image_path)
+    for user_id, image_paths in by_user.items():
+        tensor_store.remove(user_id, image_paths)
+        embedding_store.invalidate(image_paths)
+
+
+def score_outfits(model, outfits, embeddings, blank_embedding):
+    """
+    Scores a batch of outfits from cached embeddings in one head-only pass.
+    Returns a (len(outfits), 13) array of sigmoid probabilities in EVENT_LABELS order.
+    """
+    batch = np.empty((len(outfits), 7, EMBEDDING_DIM), dtype=np.float32)  # bounded by the chunk size
+    for row, outfit in enumerate(outfits):
+        for slot in range(7):
+            batch[row, slot] = embeddings[outfit[slot]] if slot < len(outfit) else blank_embedding
+
+    with STAGE_SECONDS.time(stage="head_forward"):
+        logits, _ = model.score_embeddings(batch)
+    return 1.0 / (1.0 + np.exp(-logits))
+
+
+def outfit_attention(user_id, outfit, model=None):
+    """
+    Global attention weights (7, 7) of one outfit, from cached embeddings and a single head pass.
+    Only computed on demand: bulk generation never keeps the attention it gets back.
+    """
+    model = model or get_model()
+    embeddings = get_embeddings(user_id, outfit, model)
+    batch = np.stack([embeddings[outfit[slot]] if slot < len(outfit) else get_blank_embedding(model)
+                      for slot in range(7)])[np.newaxis]
+    with STAGE_SECONDS.time(stage="head_forward"):
+        _, attention = model.score_embeddings(batch)
+    return attention[0]
+
+
+def build_slot_layouts(user_images):
+    """
+    Returns one list of slots (lists of image paths) per outfit size that can be built
+    from the wardrobe: the core categories plus the first optional categories.
+    """
     category_mapping = {}
     for img in user_images:
         category_mapping.setdefault(img.category, []).append(img.image_path)
@@ -77,8 +300,7 @@ def generate_recommendations(user_id):
         if k not in ["Tops", "All-wear", "Bottoms", "Shoes", "All-body/Tops"]
     }
 
-    valid_combinations = []
-    combo_logs = {}
+    layouts = []
 
     for r in range(2, 8):
         slots = []
@@ -104,53 +326,324 @@ def generate_recommendations(user_id):
         slots.extend(optional_slots)
 
         if len(slots) == r:
-            combos = list(product(*slots))
-            valid_combinations.extend(combos)
-            combo_logs[r] = combo_logs.get(r, 0) + len(combos)
+            layouts.append(slots)
 
-    if not valid_combinations:
-        print("⚠️ No valid filtered combinations found")
-        return
+    return layouts
+
+
+def count_combinations(layouts):
+    total = 0
+    for slots in layouts:
+        count = 1
+        for slot in slots:
+            count *= len(slot)
+        total += count
+    return total
 
-    for size, count in combo_logs.items():
-        print(f"✔️ Generated {count} outfits with {size} items")
 
-    upload_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "uploads"))
-    blank_tensor = create_blank_image_tensor()
+def iter_combinations(layouts):
+    """Lazily yields every outfit of every layout, never materializing the product."""
+    for slots in layouts:
+        yield from product(*slots)
 
-    for outfit in valid_combinations:
-        images_tensors = []
-        outfit_with_blanks = list(outfit)
-        while len(outfit_with_blanks) < 7:
-            outfit_with_blanks.append("BLANK")
 
-        for img_filename in outfit_with_blanks:
-            if img_filename == "BLANK":
-                images_tensors.append(blank_tensor)
+def iter_chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_new_combinations(layouts, new_images):
+    """
+    Lazily yields only the outfits that contain at least one image from new_images.
+    Slot i is the first slot holding a new image: earlier slots use old images only,
+    later slots use everything, so every such outfit comes out exactly once.
+    """
+    for slots in layouts:
+        for i in range(len(slots)):
+            head = [[img for img in slot if img not in new_images] for slot in slots[:i]]
+            pivot = [img for img in slots[i] if img in new_images]
+            parts = head + [pivot] + slots[i + 1:]
+            if all(parts):
+                yield from product(*parts)
+
+
+def count_new_combinations(layouts, new_images):
+    total = 0
+    for slots in layouts:
+        for i in range(len(slots)):
+            count = 1
+            for j, slot in enumerate(slots):
+                if j < i:
+                    count *= sum(1 for img in slot if img not in new_images)
+                elif j == i:
+                    count *= sum(1 for img in slot if img in new_images)
+                else:
+                    count *= len(slot)
+            total += count
+    return total
+
+
+def layouts_cover(outer, inner):
+    """True when every outfit enumerated from the inner layouts is also enumerated from the outer ones."""
+    return all(
+        any(len(o) == len(i) and all(set(i_slot) <= set(o_slot) for i_slot, o_slot in zip(i, o)) for o in outer)
+        for i in inner
+    )
+
+
+def chunk_size_for_budget(memory_budget_mb):
+    return max(1, int(memory_budget_mb * 1024 * 1024) // HEAD_BYTES_PER_OUTFIT)
+
+
+class TopOutfits:
+    """
+    Keeps the K best outfits for every event label in min-heaps.
+    Heap entries are (score, -seq, outfit, probs); seq is the position of the outfit in the
+    enumeration, so ties always keep the earlier outfit and results are deterministic
+    (also when pruning skips outfits: seqs are the positions, not a running count).
+    """
+
+    def __init__(self, top_k):
+        self.top_k = top_k
+        self.heaps = [[] for _ in EVENT_LABELS]
+
+    def push_batch(self, outfits, prob_array, seqs):
+        for event_idx, heap in enumerate(self.heaps):
+            column = prob_array[:, event_idx]
+            if len(heap) >= self.top_k:
+                # Only outfits that beat the current K-th best can get in
+                candidates = np.flatnonzero(column >= heap[0][0])
             else:
-                full_img_path = os.path.join(upload_dir, img_filename)
-                img = Image.open(full_img_path).convert("RGB")
-                images_tensors.append(transform(img).unsqueeze(0))
-
-        with torch.no_grad():
-            feature_embeddings = torch.stack([model.forward_once(img.to("cpu")) for img in images_tensors], dim=1)
-            logits, _ = model(*images_tensors)
-            probabilities = torch.sigmoid(logits)
-
-        event_labels = ["Job Interviews", "Birthday", "Graduations", "MET Gala", "Business Meeting",
-                        "Beach", "Picnic", "Summer", "Funeral", "Romantic Dinner", "Cold", "Casual", "Wedding"]
-        prob_array = probabilities.cpu().detach().numpy().flatten()
-        event_scores = {event_labels[i]: float(prob_array[i]) for i in range(len(event_labels))}
-
-        new_result = RecommendationResult(
-            user_id=user_id,
-            event="N/A",
-            outfit=json.dumps([img for img in outfit if img != "BLANK"]),
-            scores=json.dumps(event_scores),
-            match_score=max(event_scores.values()),
-            heatmap_paths="[]"
-        )
-        db.session.add(new_result)
+                candidates = range(len(outfits))
+
+            for row in candidates:
+                entry = (float(column[row]), -seqs[row], outfits[row], prob_array[row].copy())
+                if len(heap) < self.top_k:
+                    heapq.heappush(heap, entry)
+                elif entry[:2] > heap[0][:2]:
+                    heapq.heapreplace(heap, entry)
+
+    def outfits(self):
+        """Unique (outfit, probs) pairs kept by any event, in enumeration order."""
+        kept = {}
+        for heap in self.heaps:
+            for _, neg_seq, outfit, probs in heap:
+                kept[-neg_seq] = (outfit, probs)
+        return [kept[seq] for seq in sorted(kept)]
+
+
+def score_candidates(model, candidates, embeddings, blank_embedding, top_outfits, chunk_size, total,
+                     first_seq=0, progress=None, pool=None, weights_path=MODEL_PATH):
+    """
+    Full-head scoring of (position, outfit) candidates into top_outfits, as seq first_seq + position.
+    - pool: ScoringPool with workers to score shards in parallel processes, None scores in this thread
+    Returns the number of outfits scored.
+    """
+    scored = 0
+    if pool is not None and pool.workers:
+        for shard in pool.score(model, weights_path, candidates, embeddings, blank_embedding,
+                                top_outfits.top_k, chunk_size, total):
+            for seconds in shard.timings:
+                STAGE_SECONDS.observe(seconds, stage="head_forward")
+            top_outfits.push_batch(shard.outfits, shard.probs, [first_seq + int(p) for p in shard.positions])
+            scored += shard.scored
+            if progress:
+                progress(shard.last_position + 1, total)
+        return scored
+
+    for chunk in iter_chunks(candidates, chunk_size):
+        seqs = [first_seq + position for position, _ in chunk]
+        batch = [outfit for _, outfit in chunk]
+        prob_array = score_outfits(model, batch, embeddings, blank_embedding)
+        top_outfits.push_batch(batch, prob_array, seqs)
+        scored += len(batch)
+        if progress:
+            progress(seqs[-1] - first_seq + 1, total)
+    return scored
+
+
+INSERT_SCORE_SQL = "INSERT INTO recommendation_score (result_id, event, user_id, score) VALUES (?, ?, ?, ?)"
+
+
+def bulk_insert_results(user_id, results, chunk_size=None):
+    """
+    Inserts (outfit, event_scores) pairs as RecommendationResult rows plus their per-event
+    RecommendationScore rows, using executemany and committing every chunk so the SQLite
+    write lock is released between chunks and readers are not blocked.
+    """
+    chunk_size = chunk_size or current_app.config.get("RECOMMENDATION_WRITE_CHUNK", DEFAULT_WRITE_CHUNK)
+    result_table = RecommendationResult.__table__
+    for start in range(0, len(results), chunk_size):
+        chunk_start = time.perf_counter()
+        chunk = results[start:start + chunk_size]
+        rows = [{
+            "user_id": user_id,
+            "event": "N/A",
+            "outfit": json.dumps(list(outfit)),
+            "scores": json.dumps(event_scores),
+            "match_score": max(event_scores.values()),
+            "heatmap_paths": "[]"
+        } for outfit, event_scores in chunk]
+        ids = db.session.execute(
+            insert(result_table).returning(result_table.c.id, sort_by_parameter_order=True), rows
+        ).scalars().all()
+
+        # 13 rows per outfit: plain tuples through the driver skip SQLAlchemy's per-row parameter processing
+        score_rows = [
+            (result_id, event, user_id, score)
+            for result_id, (_, event_scores) in zip(ids, chunk)
+            for event, score in event_scores.items()
+        ]
+        db.session.connection().exec_driver_sql(INSERT_SCORE_SQL, score_rows)
+        db.session.commit()
+        STAGE_SECONDS.observe(time.perf_counter() - chunk_start, stage="db_write")
+    return len(results)
+
+
+def delete_results(result_ids, chunk_size=None):
+    chunk_size = chunk_size or current_app.config.get("RECOMMENDATION_WRITE_CHUNK", DEFAULT_WRITE_CHUNK)
+    for start in range(0, len(result_ids), chunk_size):
+        chunk = result_ids[start:start + chunk_size]
+        with STAGE_SECONDS.time(stage="db_write"):
+            RecommendationScore.query.filter(RecommendationScore.result_id.in_(chunk)).delete()
+            RecommendationResult.query.filter(RecommendationResult.id.in_(chunk)).delete()
+            db.session.commit()
 
+
+def generate_recommendations(user_id, new_image_paths=None, top_k=None, memory_budget_mb=None, progress=None,
+                             prune_ratio=None, prune_scorer=None):
+    """
+    Scores the user's outfits and stores the top K per event.
+    - new_image_paths: images added since the last run; when given, only outfits that
+      contain one of them are scored and merged into the stored results
+    - progress: optional callback(done, total) called after every scored chunk
+    - prune_ratio: share of the outfits a cheap scorer passes on to the full head, 1.0 scores
+      everything; prune_scorer is one of app.pruning.PRUNE_SCORERS
+    """
+    model = get_model()
+    top_k = top_k or current_app.config.get("RECOMMENDATION_TOP_K", DEFAULT_TOP_K)
+    memory_budget_mb = memory_budget_mb or current_app.config.get(
+        "RECOMMENDATION_MEMORY_BUDGET_MB", DEFAULT_MEMORY_BUDGET_MB)
+    prune_ratio = prune_ratio or current_app.config.get("RECOMMENDATION_PRUNE_RATIO", DEFAULT_PRUNE_RATIO)
+    prune_scorer = prune_scorer or current_app.config.get("RECOMMENDATION_PRUNE_SCORER", DEFAULT_PRUNE_SCORER)
+
+    user_images = ImageModel.query.filter_by(user_id=user_id, status="ready").all()
+    layouts = build_slot_layouts(user_images)
+    existing = RecommendationResult.query.filter_by(user_id=user_id).all()
+
+    new_images = set(new_image_paths or []) & {img.image_path for img in user_images}
+    incremental = bool(new_images and existing)
+    if incremental:
+        old_layouts = build_slot_layouts([img for img in user_images if img.image_path not in new_images])
+        # A new core category changes which outfit shapes are valid, old results no longer apply
+        incremental = layouts_cover(layouts, old_layouts)
+
+    if incremental:
+        print(f"🔄 Updating recommendations for user {user_id} with {len(new_images)} new images")
+        make_combinations = partial(iter_new_combinations, layouts, new_images)
+        total = count_new_combinations(layouts, new_images)
+    else:
+        print(f"🔄 Generating recommendations for user: {user_id}")
+        make_combinations = partial(iter_combinations, layouts)
+        total = count_combinations(layouts)
+        for slots in layouts:
+            print(f"✔️ Generating {count_combinations([slots])} outfits with {len(slots)} items")
+
+    top_outfits = TopOutfits(top_k)
+    seq = 0
+    scored = 0
+    kept_rows = {}
+    if incremental:
+        # Stored results compete with the new outfits for the same K slots
+        kept_rows = {tuple(json.loads(rec.outfit)): rec for rec in existing}
+        outfits = list(kept_rows)
+        scores = [json.loads(rec.scores) for rec in kept_rows.values()]
+        prob_array = np.array([[s.get(event, 0.0) for event in EVENT_LABELS] for s in scores], dtype=np.float32)
+        top_outfits.push_batch(outfits, prob_array, range(len(outfits)))
+        seq += len(outfits)
+
+    if not layouts:
+        print("⚠️ No valid filtered combinations found")
+    else:
+        embeddings = get_embeddings(user_id, {img for slots in layouts for slot in slots for img in slot}, model)
+        blank_embedding = get_blank_embedding(model)
+
+        chunk_size = chunk_size_for_budget(memory_budget_mb)
+        budget = candidate_budget(total, prune_ratio, top_k)
+        if budget < total:
+            # Only the outfits the cheap scorer ranks best for some event reach the full head
+            scorer = create_scorer(prune_scorer, model, embeddings, blank_embedding)
+            candidates = select_candidates(lambda: iter_chunks(make_combinations(), chunk_size), scorer, budget)
+            print(f"✂️ Pruning to {budget} of {total} outfits ({prune_scorer} scorer)")
+        else:
+            candidates = enumerate(make_combinations())
+
+        # Large searches go to the scoring processes when RECOMMENDATION_SCORING_WORKERS is set
+        pool = scoring_pool if scoring_pool.workers and budget >= SHARDED_SCORING_MIN_OUTFITS else None
+        scored = score_candidates(model, candidates, embeddings, blank_embedding, top_outfits, chunk_size, total,
+                                  first_seq=seq, progress=progress, pool=pool)
+        seq += total
+
+    kept = top_outfits.outfits()
+    kept_outfits = {tuple(outfit) for outfit, _ in kept}
+
+    stale_ids = []
+    for rec in existing:
+        outfit = tuple(json.loads(rec.outfit))
+        # Drop everything on a full run; otherwise outfits pushed out of every heap and duplicate rows
+        if not incremental or outfit not in kept_outfits or kept_rows[outfit] is not rec:
+            stale_ids.append(rec.id)
+    delete_results(stale_ids)
+
+    results = [
+        (outfit, {EVENT_LABELS[i]: float(probs[i]) for i in range(len(EVENT_LABELS))})
+        for outfit, probs in kept if tuple(outfit) not in kept_rows
+    ]
+    added = bulk_insert_results(user_id, results)
+    User.bump_cache_version(user_id)
     db.session.commit()
-    print(f"✅ Filtered recommendations saved for user {user_id}")
\ No newline at end of file
+
+    print(f"✅ Stored {added} new and dropped {len(stale_ids)} old recommendations "
+          f"(top {top_k} per event, {seq} outfits ranked, {scored} by the full head) for user {user_id}")
+
+
+def remove_images_from_recommendations(user_id, removed_images):
+    """
+    Drops the stored recommendations that use any of the removed images.
+    - removed_images: (image_path, category) pairs that were just deleted for this user
+    Returns False when a full rebuild is needed: the deletion changed the outfit shapes, or
+    took away one of an event's top K outfits and the one that moves up was never stored.
+    """
+    top_k = current_app.config.get("RECOMMENDATION_TOP_K", DEFAULT_TOP_K)
+    removed_paths = {image_path for image_path, _ in removed_images}
+    remaining = ImageModel.query.filter_by(user_id=user_id, status="ready").all()
+    before = remaining + [WardrobeItem(image_path, category) for image_path, category in removed_images]
+
+    results = RecommendationResult.query.filter_by(user_id=user_id).all()
+    scores = {rec.id: json.loads(rec.scores) for rec in results}
+    affected_ids = [rec.id for rec in results if removed_paths.intersection(json.loads(rec.outfit))]
+
+    # Only the top K per event are stored, so removing one of them leaves a gap that only a
+    # rebuild can fill, unless every outfit of the smaller wardrobe is stored already
+    remaining_layouts = build_slot_layouts(remaining)
+    complete = len(results) - len(affected_ids) >= count_combinations(remaining_layouts)
+    lost_top = False
+    if affected_ids and not complete:
+        for event in EVENT_LABELS:
+            ranked = sorted((s.get(event, 0.0) for s in scores.values()), reverse=True)
+            cutoff = ranked[min(top_k, len(ranked)) - 1]
+            if any(scores[result_id].get(event, 0.0) >= cutoff for result_id in affected_ids):
+                lost_top = True
+                break
+
+    delete_results(affected_ids)
+    User.bump_cache_version(user_id)
+    db.session.commit()
+    print(f"🧹 Removed {len(affected_ids)} recommendations using deleted images for user {user_id}")
+
+    # Outfits of the smaller wardrobe must all have been candidates before the deletion
+    return not lost_top and layouts_cover(build_slot_layouts(before), remaining_layouts)
@@ -0,0 +1,102 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from flask import request, current_app
+
+from app.database import db, User
+
+
+class ResponseCache:
+    """
+    In-process LRU of serialized JSON responses for the per-user read endpoints.
+    - Entries are keyed by (endpoint, user, User.cache_version, parameters): bumping the
+      version makes every older entry unreachable, LRU eviction drops them later
+    - The ETag is derived from the same key, so every worker agrees on it and a matching
+      If-None-Match on a GET is answered with 304 without building the response
+    - Only 200 responses are cached, bounded by entry count and total body size; the host the
+      request came in on is part of the key because bodies contain absolute URLs
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (serialized body, mimetype, extra headers)
+        self._bytes = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.max_entries = app.config.get("RESPONSE_CACHE_MAX_ENTRIES", 1024)
+        self.max_bytes = app.config.get("RESPONSE_CACHE_MAX_MB", 32) * 1024 * 1024
+
+    @staticmethod
+    def version(user_id):
+        try:
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            return None
+        return db.session.query(User.cache_version).filter(User.id == user_id).scalar()
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def _put(self, key, entry):
+        size = len(entry[0])
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous[0])
+            self._entries[key] = entry
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted[0])
+
+    def respond(self, user_id, params, build, store=True):
+        """
+        Serves build() through the cache.
+        - params: everything besides the user the response depends on (hashable)
+        - build: returns what a view returns; errors and non-200 responses are passed through uncached
+        - store: False for streamed responses, which only get the ETag and 304 handling
+        """
+        version = self.version(user_id)
+        if version is None:
+            return build()
+
+        key = (request.endpoint, request.host_url, int(user_id), version, params)
+        etag = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+
+        if request.method in ("GET", "HEAD") and etag in request.if_none_match:
+            response = current_app.response_class(status=304)
+        else:
+            entry = self._get(key) if store else None
+            if entry is not None:
+                body, mimetype, headers = entry
+                response = current_app.response_class(body, status=200, mimetype=mimetype, headers=headers)
+            else:
+                response = current_app.make_response(build())
+                if response.status_code != 200:
+                    return response
+                if store:
+                    headers = [(k, v) for k, v in response.headers if k not in ("Content-Type", "Content-Length")]
+                    self._put(key, (response.get_data(), response.mimetype, headers))
+
+        response.set_etag(etag)
+        # Clients may keep the body but have to revalidate it on every use
+        response.headers["Cache-Control"] = "private, no-cache"
+        return response
+
+    def stats(self):
+        with self._lock:
+            return len(self._entries), self._bytes
+
+
+response_cache = ResponseCache()
@@ -3,9 +3,13 @@ import torch.nn as nn
 import torchvision.models as models
 
 class SiameseNetwork(nn.Module):
-    def __init__(self):
+    def __init__(self, pretrained=False):
+        """
+        - pretrained: start the backbone from ImageNet weights (downloads them), only useful
+          for training; inference loads a full checkpoint over every parameter anyway
+        """
         super(SiameseNetwork, self).__init__()
-        self.base_cnn = models.resnet50(weights=models.ResNet50_Weights.DEFAULT)
+        self.base_cnn = models.resnet50(weights=models.ResNet50_Weights.DEFAULT if pretrained else None)
 
         # Freeze initial layers, fine-tune deeper layers
         for name, param in self.base_cnn.named_parameters():
@@ -48,9 +52,34 @@ class SiameseNetwork(nn.Module):
         output = output.mean(dim=2)
         return output
 
+    def encode(self, images):
+        """
+        Encoder half of the network: pooled backbone features.
+        - images: (N, 3, 224, 224) -> (N, 2048)
+        """
+        return self.forward_once(images)
+
+    def score_embeddings(self, embeddings):
+        """
+        Head half of the network for a batch of independent outfits.
+        - embeddings: precomputed encoder output, shape (B, 7, 2048)
+        - returns logits (B, 13) and per-outfit global attention weights (B, 7, 7)
+
+        Global attention is restricted to the images of each outfit, so row i is
+        the same score forward_head gives for outfit i on its own (B=1).
+        """
+        return self.forward_head(embeddings, per_outfit=True)
+
     def forward(self, *inputs):
         embeddings = torch.stack([self.forward_once(img) for img in inputs], dim=1)  # (B, 7, 2048)
+        return self.forward_head(embeddings)
 
+    def forward_head(self, embeddings, per_outfit=False):
+        """
+        Runs everything after the backbone (attention, fc, classifier).
+        - embeddings: pooled backbone features from forward_once, shape (B, 7, 2048)
+        - per_outfit: keep global attention inside each outfit instead of across the batch
+        """
         # Self-Attention on Layer 2
         attended_embeddings_layer2, _ = self.self_attention_layer2(embeddings[:, :, :512])
         attended_embeddings_layer2 = torch.cat((attended_embeddings_layer2, embeddings[:, :, 512:]), dim=2)
@@ -66,7 +95,7 @@ class SiameseNetwork(nn.Module):
         cross_attended_embeddings, _ = self.cross_attention(attended_embeddings_layer4, attended_embeddings_layer4)
 
         # Global Attention (learn global context across outfits)
-        global_attended_embeddings, attention_weights = self.global_attention(cross_attended_embeddings)
+        global_attended_embeddings, attention_weights = self.global_attention(cross_attended_embeddings, per_outfit=per_outfit)
 
         # Fully Connected Network
         refined_embeddings = global_attended_embeddings.view(-1, 7, 2048)
@@ -130,12 +159,25 @@ class GlobalAttention(nn.Module):
         self.value = nn.Linear(in_dim, in_dim)
         self.softmax = nn.Softmax(dim=-1)
 
-    def forward(self, x):
+    def forward(self, x, per_outfit=False):
         """
         Global Attention: Allows each outfit image to attend to **all images in the batch**.
         - x: Feature tensor (B, 5, F)
+        - per_outfit: only attend to images of the same outfit, weights come back as (B, 5, 5)
         """
         batch_size, num_images, feat_dim = x.shape  # (B, 5, F)
+
+        if per_outfit:
+            # Same math as the flattened path with B=1, done for every outfit at once
+            Q = self.query(x)  # (B, 5, F//8)
+            K = self.key(x).transpose(1, 2)  # (B, F//8, 5)
+            V = self.value(x)  # (B, 5, F)
+
+            attention_weights = self.softmax(torch.bmm(Q, K))  # (B, 5, 5)
+            attended_values = torch.bmm(attention_weights, V)
+
+            return attended_values + x, attention_weights
+
         x_flat = x.view(batch_size * num_images, feat_dim)  # Flatten across batch
 
         Q = self.query(x_flat)  # (B*5, F//8)
@@ -0,0 +1,212 @@
+import os
+import time
+import threading
+
+# Processed uploads are named after the SHA-256 of the uploaded bytes and sharded two levels
+# deep (ab/cd/abcd....jpg), so no directory grows past a few hundred entries and identical
+# uploads share one file. Images stored before sharding keep their flat names.
+# The background removal processes import this module too: keep its imports light.
+RESERVED_DIRS = ("incoming", "derived")  # not image keys, never served under /uploads
+STAGING_SUFFIX = ".upload"
+
+
+def shard_key(digest, extension=".jpg"):
+    """ImageModel.image_path of a processed upload: relative to the upload folder, '/' separated."""
+    return f"{digest[:2]}/{digest[2:4]}/{digest}{extension}"
+
+
+def atomic_write(path, write):
+    """
+    Calls write(tmp_path) and renames the result over path, so a partial file is never visible.
+    The temporary name is unique per process and thread: concurrent writers of one path cannot clash.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        _discard(tmp_path)
+        raise
+
+
+def _discard(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class UploadStorage:
+    """
+    Processed uploads, their derivatives and staged raw uploads under UPLOAD_FOLDER.
+    - remove() deletes the files of deleted images right away, unless another row still uses them
+    - collect_garbage() reconciles disk and ImageModel rows in small steps: each step checks a
+      bounded number of files (orphans, stale temp and staging files) and of ready rows
+      (file missing), continuing where the previous step stopped
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._files = None  # iterator over the current sweep
+        self._row_cursor = ""
+        self._swept = {"files": 0, "removed": 0, "missing": 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.root = os.path.abspath(app.config["UPLOAD_FOLDER"])
+        self.batch_size = app.config.get("STORAGE_GC_BATCH", 1000)
+        self.interval = app.config.get("STORAGE_GC_INTERVAL_SECONDS", 10)
+        self.grace = app.config.get("STORAGE_GC_GRACE_SECONDS", 3600)
+
+    def path(self, key):
+        return os.path.join(self.root, *key.split("/"))
+
+    def _files_of(self, key):
+        from app.derivatives import DERIVATIVE_SIZES, derivative_path
+
+        yield self.path(key)
+        for size in DERIVATIVE_SIZES:
+            yield derivative_path(self.root, key, size)
+
+    @staticmethod
+    def _referenced(keys):
+        from app.database import db, ImageModel
+
+        referenced = set()
+        keys = list(keys)
+        for start in range(0, len(keys), 500):
+            referenced.update(path for (path,) in db.session.query(ImageModel.image_path)
+                              .filter(ImageModel.image_path.in_(keys[start:start + 500])))
+        return referenced
+
+    def remove(self, keys):
+        """Deletes the files of the keys no ImageModel row refers to any more. Returns how many were freed."""
+        keys = set(keys)
+        unreferenced = keys - self._referenced(keys)
+        for key in unreferenced:
+            for path in self._files_of(key):
+                _discard(path)
+        return len(unreferenced)
+
+    def _walk(self):
+        """Yields (kind, key, path) for every file: kind is "image", "derived", "incoming" or "tmp"."""
+        for directory, subdirs, filenames in os.walk(self.root):
+            relative = os.path.relpath(directory, self.root).replace(os.sep, "/")
+            parts = [] if relative == "." else relative.split("/")
+            subdirs.sort()
+            for name in sorted(filenames):
+                path = os.path.join(directory, name)
+                if name.endswith(".tmp"):
+                    yield "tmp", None, path
+                elif parts[:1] == ["incoming"]:
+                    yield "incoming", name[:-len(STAGING_SUFFIX)] if name.endswith(STAGING_SUFFIX) else None, path
+                elif parts[:1] == ["derived"]:
+                    yield "derived", "/".join(parts[2:] + [name]), path
+                else:
+                    yield "image", "/".join(parts + [name]), path
+
+    def _old(self, path, now):
+        try:
+            return now - os.path.getmtime(path) > self.grace
+        except FileNotFoundError:
+            return False
+
+    def _sweep_files(self, limit):
+        from app.database import db, ImageModel
+
+        if self._files is None:
+            self._files = self._walk()
+        batch = []
+        for item in self._files:
+            batch.append(item)
+            if len(batch) >= limit:
+                break
+        else:
+            self._files = None  # sweep finished, the next step starts over
+
+        now = time.time()
+        referenced = self._referenced({key for kind, key, _ in batch if kind in ("image", "derived")})
+        staged_ids = {key for kind, key, _ in batch if kind == "incoming" and key}
+        processing = {image_id for (image_id,) in db.session.query(ImageModel.id)
+                      .filter(ImageModel.id.in_(staged_ids), ImageModel.status == "processing")} if staged_ids else set()
+
+        removed = 0
+        for kind, key, path in batch:
+            if kind in ("image", "derived"):
+                orphan = key not in referenced
+            elif kind == "incoming":
+                orphan = key not in processing
+            else:
+                orphan = True
+            if orphan and self._old(path, now):
+                _discard(path)
+                removed += 1
+        return len(batch), removed
+
+    def _reconcile_rows(self, limit):
+        """Marks ready images whose file is gone as failed and drops them from recommendations."""
+        from app.database import db, ImageModel, User
+        from app.jobs import scheduler
+        from app.recommend_outfits import invalidate_images, remove_images_from_recommendations
+
+        rows = (ImageModel.query.filter(ImageModel.id > self._row_cursor, ImageModel.status == "ready")
+                .order_by(ImageModel.id).limit(limit).all())
+        self._row_cursor = rows[-1].id if len(rows) == limit else ""
+
+        missing = [img for img in rows if not os.path.exists(self.path(img.image_path))]
+        for img in missing:
+            print(f"⚠️ Image file of {img.id} is missing, marking it failed")
+            img.status = "failed"
+            img.error = "The image file is missing, please upload it again."
+            User.bump_cache_version(img.user_id)
+        if missing:
+            db.session.commit()
+            invalidate_images([(img.user_id, img.image_path) for img in missing])
+            for user_id in {img.user_id for img in missing}:
+                lost = [(img.image_path, img.category) for img in missing if img.user_id == user_id]
+                if not remove_images_from_recommendations(user_id, lost):
+                    scheduler.enqueue(user_id)
+        return len(missing)
+
+    def collect_garbage(self, batch_size=None):
+        """One incremental step; needs an app context. Returns (files checked, files removed, images missing)."""
+        from app.metrics import STAGE_SECONDS
+
+        batch_size = batch_size or self.batch_size
+        with self._lock, STAGE_SECONDS.time(stage="storage_gc"):
+            checked, removed = self._sweep_files(batch_size)
+            missing = self._reconcile_rows(batch_size)
+
+            self._swept["files"] += checked
+            self._swept["removed"] += removed
+            self._swept["missing"] += missing
+            if self._files is None:
+                if self._swept["removed"] or self._swept["missing"]:
+                    print(f"🧹 Storage sweep: checked {self._swept['files']} files, removed {self._swept['removed']} "
+                          f"orphans, {self._swept['missing']} images missing on disk")
+                self._swept = {"files": 0, "removed": 0, "missing": 0}
+        return checked, removed, missing
+
+    def start(self):
+        """Starts the background sweep (once per process); STORAGE_GC_INTERVAL_SECONDS=0 disables it."""
+        if self._thread is not None or not self.interval:
+            return
+        self._thread = threading.Thread(target=self._gc_loop, name="storage-gc", daemon=True)
+        self._thread.start()
+
+    def _gc_loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                with self.app.app_context():
+                    self.collect_garbage()
+            except Exception as e:
+                print(f"❌ Storage garbage collection failed: {e}")
+
+
+storage = UploadStorage()
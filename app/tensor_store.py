@@ -0,0 +1,131 @@
+import os
+import json
+import fcntl
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+from app.storage import atomic_write
+
+TENSOR_SHAPE = (3, 224, 224)
+
+
+class TensorStore:
+    """
+    Preprocessed garment tensors, one memory-mapped .npy array per user.
+    - <root>/user_<id>.npy holds a (capacity, 3, 224, 224) float32 array
+    - <root>/user_<id>.json maps image paths to rows and lists free rows
+    - Reads return views into the memory map, so no JPEG is decoded twice
+    Requests and jobs of any process write to the same files: every read-modify-write of a
+    user's index and array holds an flock on <root>/user_<id>.lock, and the files are
+    replaced atomically so readers never see a partial one.
+    """
+
+    def __init__(self, root, initial_capacity=16):
+        self.root = root
+        self.initial_capacity = initial_capacity
+        self._lock = threading.Lock()
+        self._maps = {}  # user_id -> (index generation, read-only memmap)
+
+    @contextmanager
+    def _locked(self, user_id):
+        """Exclusive access to the user's files, across threads and processes."""
+        os.makedirs(self.root, exist_ok=True)
+        with self._lock, open(os.path.join(self.root, f"user_{user_id}.lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _paths(self, user_id):
+        return (os.path.join(self.root, f"user_{user_id}.npy"),
+                os.path.join(self.root, f"user_{user_id}.json"))
+
+    def _load_index(self, user_id):
+        _, index_path = self._paths(user_id)
+        try:
+            with open(index_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {"generation": 0, "capacity": 0, "rows": {}, "free": []}
+
+    def _save_index(self, user_id, index):
+        _, index_path = self._paths(user_id)
+
+        def write(tmp_path):
+            with open(tmp_path, "w") as f:
+                json.dump(index, f)
+
+        atomic_write(index_path, write)
+
+    def _grow(self, user_id, index):
+        """Copies the array into a file with twice the rows and swaps it in."""
+        array_path, _ = self._paths(user_id)
+        capacity = max(self.initial_capacity, index["capacity"] * 2)
+
+        def write(tmp_path):
+            grown = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32, shape=(capacity,) + TENSOR_SHAPE)
+            if index["capacity"]:
+                old = np.load(array_path, mmap_mode="r")
+                grown[:index["capacity"]] = old[:index["capacity"]]
+                del old
+            grown.flush()
+            del grown
+
+        atomic_write(array_path, write)
+
+        index["free"].extend(range(index["capacity"], capacity))
+        index["capacity"] = capacity
+        index["generation"] += 1
+
+    def contains(self, user_id, image_path):
+        return image_path in self._load_index(user_id)["rows"]
+
+    def put_many(self, user_id, tensors):
+        """Stores {image_path: (3, 224, 224) array} for the user."""
+        if not tensors:
+            return
+        array_path, _ = self._paths(user_id)
+
+        with self._locked(user_id):
+            index = self._load_index(user_id)
+            while len(index["free"]) < len(tensors):
+                self._grow(user_id, index)
+
+            array = np.load(array_path, mmap_mode="r+")
+            for image_path, tensor in tensors.items():
+                row = index["rows"].get(image_path)
+                if row is None:
+                    row = index["free"].pop()
+                    index["rows"][image_path] = row
+                array[row] = tensor
+            array.flush()
+            del array
+            self._save_index(user_id, index)
+
+    def get_many(self, user_id, image_paths):
+        """Returns {image_path: read-only view} for the paths that are stored."""
+        index = self._load_index(user_id)
+        rows = {p: index["rows"][p] for p in image_paths if p in index["rows"]}
+        if not rows:
+            return {}
+
+        with self._lock:
+            cached = self._maps.get(user_id)
+            if cached is None or cached[0] != index["generation"]:
+                array_path, _ = self._paths(user_id)
+                cached = (index["generation"], np.load(array_path, mmap_mode="r"))
+                self._maps[user_id] = cached
+        array = cached[1]
+        return {p: array[row] for p, row in rows.items()}
+
+    def remove(self, user_id, image_paths):
+        """Frees the rows of deleted images; the space is reused by the next put."""
+        with self._locked(user_id):
+            index = self._load_index(user_id)
+            freed = [index["rows"].pop(p) for p in image_paths if p in index["rows"]]
+            if freed:
+                index["free"].extend(freed)
+                self._save_index(user_id, index)
@@ -7,6 +7,7 @@ import * as ImagePicker from 'expo-image-picker';
 import { useLocalSearchParams, useRouter } from 'expo-router';
 import Icon from 'react-native-vector-icons/Ionicons';
 import { Picker } from '@react-native-picker/picker';
+import AsyncStorage from '@react-native-async-storage/async-storage';
 
 const API_URL = "http://192.168.1.8:5000"; // Flask API Server
 const TECH_API_URL = "http://172.16.100.209:5000";
@@ -29,7 +30,8 @@ export default function UploadImage() {
   const fetchImages = async () => {
     setLoading(true);
     try {
-      const response = await fetch(`${TECH_API_URL}/images/${category}`);
+      const id = userId || await AsyncStorage.getItem('user_id');
+      const response = await fetch(`${TECH_API_URL}/images/${category}?user_id=${id}`);
       const data = await response.json();
 
       if (!Array.isArray(data)) {
@@ -111,7 +113,13 @@ export default function UploadImage() {
       setLoading(false);
   
       if (response.ok) {
-        Alert.alert("✅ Success", "Images uploaded successfully!");
+        const results = resultData.images || [];
+        const duplicates = results.filter(img => img.duplicate_of).length;
+        const similar = results.filter(img => img.near_duplicates).length;
+        let message = "Images uploaded successfully!";
+        if (duplicates) message += `\n${duplicates} already in your wardrobe, kept the existing one.`;
+        if (similar) message += `\n${similar} look very similar to clothes you already uploaded.`;
+        Alert.alert("✅ Success", message);
         setSelectedImages([]);
         fetchImages();
         router.push('/home');
@@ -0,0 +1,102 @@
+"""
+Compares the per-row ORM write path for recommendations with bulk_insert_results.
+Both write a RecommendationResult plus its 13 per-event RecommendationScore rows;
+"orm (results only)" is the pre-score-table path for reference.
+
+    python -m benchmarks.bench_bulk_insert --rows 10000 50000
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+
+from flask import Flask
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.database import db, User, RecommendationResult, RecommendationScore
+from app.recommend_outfits import EVENT_LABELS, bulk_insert_results
+
+
+def make_results(n):
+    results = []
+    for i in range(n):
+        outfit = [f"{i}_{slot}.jpg" for slot in range(random.randint(2, 7))]
+        results.append((outfit, {event: random.random() for event in EVENT_LABELS}))
+    return results
+
+
+def orm_insert(user_id, results, with_scores=True):
+    # What generate_recommendations used to do: one ORM object per outfit, one commit at the end
+    for outfit, scores in results:
+        rec = RecommendationResult(
+            user_id=user_id,
+            event="N/A",
+            outfit=json.dumps(outfit),
+            scores=json.dumps(scores),
+            match_score=max(scores.values()),
+            heatmap_paths="[]"
+        )
+        db.session.add(rec)
+        if with_scores:
+            db.session.flush()
+            for event, score in scores.items():
+                db.session.add(RecommendationScore(result_id=rec.id, user_id=user_id, event=event, score=score))
+    db.session.commit()
+
+
+def orm_insert_results_only(user_id, results):
+    orm_insert(user_id, results, with_scores=False)
+
+
+def timed(fn, user_id, results):
+    RecommendationScore.query.delete()
+    RecommendationResult.query.delete()
+    db.session.commit()
+    db.session.expunge_all()
+    start = time.perf_counter()
+    fn(user_id, results)
+    elapsed = time.perf_counter() - start
+    assert RecommendationResult.query.count() == len(results)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 50000])
+    parser.add_argument("--chunk", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = Flask(__name__)
+        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + os.path.join(tmp, "bench.db")
+        app.config["RECOMMENDATION_WRITE_CHUNK"] = args.chunk
+        db.init_app(app)
+
+        with app.app_context():
+            db.create_all()
+            user = User(username="bench", password="x")
+            db.session.add(user)
+            db.session.commit()
+            user_id = user.id
+
+            results = []
+            for n in args.rows:
+                results_in = make_results(n)
+                orm_only = timed(orm_insert_results_only, user_id, results_in)
+                orm = timed(orm_insert, user_id, results_in)
+                bulk = timed(bulk_insert_results, user_id, results_in)
+                results.append({"rows": n, "orm_results_only_seconds": round(orm_only, 3),
+                                "orm_seconds": round(orm, 3), "bulk_seconds": round(bulk, 3),
+                                "speedup": round(orm / bulk, 2)})
+                print(f"{n:>7} rows  orm (results only) {orm_only:7.3f}s  orm {orm:7.3f}s  "
+                      f"bulk {bulk:7.3f}s  ({orm / bulk:.1f}x)")
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Measures server cold start in fresh interpreters: time until /ready answers 200 (model
+loaded and warmed up in the background), plus one MODEL_WARMUP=lazy run that shows what
+importing app.main costs and which heavy modules it pulls in on its own.
+Each run uses an empty database, upload folder and caches in a temp dir.
+
+    python -m benchmarks.bench_cold_start --weights app/siamese_model.pt --runs 3
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+HEAVY_MODULES = ["torch", "torchvision", "onnxruntime", "rembg", "mlxtend", "pandas", "gdown"]
+
+CHILD = """
+import os, sys, json, time
+start = time.perf_counter()
+import app.main as main
+imported = time.perf_counter()
+heavy = [m for m in {heavy!r} if m in sys.modules]
+
+client = main.app.test_client()
+status = None
+while time.perf_counter() - start < {timeout}:
+    response = client.get("/ready")
+    status = response.get_json()["status"]
+    if response.status_code == 200 or status in ("failed", "not_loaded"):
+        break
+    time.sleep(0.02)
+ready = time.perf_counter()
+print(json.dumps({{"import_seconds": imported - start, "ready_seconds": ready - start,
+                  "status": status, "heavy_modules_after_import": heavy}}), flush=True)
+os._exit(0)  # don't wait on (or tear down) the worker threads
+"""
+
+
+def run_once(weights, backend, timeout, warmup="background"):
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ,
+                   DATABASE_PATH=os.path.join(tmp, "database.db"),
+                   UPLOAD_FOLDER=os.path.join(tmp, "uploads"),
+                   EMBEDDING_CACHE_DIR=os.path.join(tmp, "embeddings"),
+                   TENSOR_STORE_DIR=os.path.join(tmp, "tensors"),
+                   MODEL_PATH=weights,
+                   INFERENCE_BACKEND=backend,
+                   MODEL_WARMUP=warmup)
+        start = time.perf_counter()
+        child = subprocess.run([sys.executable, "-c", CHILD.format(heavy=HEAVY_MODULES, timeout=timeout)],
+                               cwd=REPO_DIR, env=env, capture_output=True, text=True)
+        wall = time.perf_counter() - start
+        if child.returncode != 0:
+            raise RuntimeError(child.stderr[-2000:])
+        result = json.loads(child.stdout.strip().splitlines()[-1])
+        result["process_wall_seconds"] = wall
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--weights", default=os.path.join(REPO_DIR, "app", "siamese_model.pt"))
+    parser.add_argument("--backend", default="torch")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=300)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.weights):
+        sys.exit(f"Model weights not found at {args.weights}")
+
+    lazy = run_once(os.path.abspath(args.weights), args.backend, args.timeout, warmup="lazy")
+    print(f"lazy import: {lazy['import_seconds']:.2f}s  "
+          f"heavy after import: {', '.join(lazy['heavy_modules_after_import']) or 'none'}")
+
+    results = []
+    for i in range(args.runs):
+        result = run_once(os.path.abspath(args.weights), args.backend, args.timeout)
+        results.append(result)
+        print(f"run {i + 1}: import {result['import_seconds']:.2f}s  ready {result['ready_seconds']:.2f}s "
+              f"({result['status']})")
+
+    summary = {
+        "backend": args.backend,
+        "lazy_import_seconds": lazy["import_seconds"],
+        "heavy_modules_after_lazy_import": lazy["heavy_modules_after_import"],
+        "runs": results,
+        "median_import_seconds": sorted(r["import_seconds"] for r in results)[len(results) // 2],
+        "median_ready_seconds": sorted(r["ready_seconds"] for r in results)[len(results) // 2],
+    }
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
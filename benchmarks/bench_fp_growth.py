@@ -0,0 +1,134 @@
+"""
+Compares the old /fp_growth_saved path (one ImageModel query per clothes id, TransactionEncoder,
+pandas and mlxtend fpgrowth on every request) with the per-user FP-tree in app.fp_growth:
+cold (first request in the process), cached (repeat request) and after one more saved outfit
+(incremental update). Both must return the same item sets and supports.
+
+    python -m benchmarks.bench_fp_growth --saved 50 200 1000 --min-support 0.3 0.05 0.01
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+
+from flask import Flask
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.database import db, User, ImageModel, Saved
+from app.fp_growth import SavedOutfitMiner
+
+
+def mlxtend_path(user_id, min_support):
+    # What /fp_growth_saved used to do
+    from mlxtend.frequent_patterns import fpgrowth
+    from mlxtend.preprocessing import TransactionEncoder
+    import pandas as pd
+
+    transactions = []
+    for saved in Saved.query.filter_by(user_id=user_id).all():
+        clothing_ids = []
+        for image_id in saved.clothes_ids:
+            image = ImageModel.query.filter_by(id=image_id, user_id=int(user_id)).first()
+            if image:
+                clothing_ids.append(image.id)
+        if clothing_ids:
+            transactions.append(clothing_ids)
+
+    te = TransactionEncoder()
+    te_ary = te.fit(transactions).transform(transactions)
+    df = pd.DataFrame(te_ary, columns=te.columns_)
+    frequent_itemsets = fpgrowth(df, min_support=min_support, use_colnames=True)
+    return {frozenset(row["itemsets"]): row["support"] for row in frequent_itemsets.to_dict(orient="records")}
+
+
+def native_path(miner, user_id, min_support):
+    _, itemsets, _ = miner.frequent_itemsets(user_id, min_support)
+    return {frozenset(items): support for items, support in itemsets}
+
+
+def make_wardrobe(user_id, saved_count):
+    # A wardrobe of 60 items where a few favourite pieces show up in most saved outfits
+    categories = {"TOP": 20, "BTM": 15, "SHO": 10, "ACC": 15}
+    images = {c: [f"U{user_id}{c}{i:02d}" for i in range(n)] for c, n in categories.items()}
+    for c, ids in images.items():
+        for image_id in ids:
+            db.session.add(ImageModel(id=image_id, image_path=f"{image_id}.jpg", category=c, user_id=user_id))
+    for _ in range(saved_count):
+        db.session.add(make_saved(user_id, images))
+    db.session.commit()
+    return images
+
+
+def make_saved(user_id, images):
+    outfit = [random.choice(ids[:2]) if random.random() < 0.8 else random.choice(ids)
+              for c, ids in images.items() if c != "ACC" or random.random() < 0.5]
+    return Saved(user_id=str(user_id), event="Casual", outfit=[f"/uploads/{i}.jpg" for i in outfit], clothes_ids=outfit)
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def same(a, b):
+    return a.keys() == b.keys() and all(abs(a[k] - b[k]) < 1e-9 for k in a)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--saved", type=int, nargs="+", default=[50, 200, 1000])
+    parser.add_argument("--min-support", type=float, nargs="+", default=[0.3, 0.05, 0.01])
+    args = parser.parse_args()
+
+    random.seed(0)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        app = Flask(__name__)
+        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + os.path.join(tmp, "bench.db")
+        db.init_app(app)
+
+        with app.app_context():
+            db.create_all()
+            for saved_count in args.saved:
+                user = User(username=f"bench{saved_count}", password="x")
+                db.session.add(user)
+                db.session.commit()
+                user_id = str(user.id)
+                images = make_wardrobe(user.id, saved_count)
+                mlxtend_path(user_id, 1.0)  # imports and first-call costs stay out of the measurement
+
+                for min_support in args.min_support:
+                    miner = SavedOutfitMiner()
+                    reference, mlxtend_seconds = timed(mlxtend_path, user_id, min_support)
+                    cold, cold_seconds = timed(native_path, miner, user_id, min_support)
+                    cached, cached_seconds = timed(native_path, miner, user_id, min_support)
+
+                    extra = make_saved(user.id, images)
+                    db.session.add(extra)
+                    db.session.commit()
+                    miner.saved(user_id, extra.id, extra.clothes_ids)
+                    updated, updated_seconds = timed(native_path, miner, user_id, min_support)
+                    reference_updated = mlxtend_path(user_id, min_support)
+                    db.session.delete(extra)
+                    db.session.commit()
+
+                    assert same(reference, cold) and same(reference, cached) and same(reference_updated, updated)
+                    row = {"saved_outfits": saved_count, "min_support": min_support, "itemsets": len(reference),
+                           "mlxtend_ms": round(mlxtend_seconds * 1000, 2), "native_cold_ms": round(cold_seconds * 1000, 2),
+                           "native_cached_ms": round(cached_seconds * 1000, 2),
+                           "native_after_save_ms": round(updated_seconds * 1000, 2)}
+                    results.append(row)
+                    print(f"{saved_count:>5} saved  min_support {min_support:<5} {len(reference):>5} itemsets  "
+                          f"mlxtend {row['mlxtend_ms']:9.2f}ms  native cold {row['native_cold_ms']:8.2f}ms  "
+                          f"cached {row['native_cached_ms']:7.2f}ms  after save {row['native_after_save_ms']:7.2f}ms")
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Compares the inference backends (torch, onnx, onnx-int8) on CPU.
+Parity: sigmoid scores of the 13 event labels against the torch backend, for the same
+outfits built from the same images. Throughput: images/s through the encoder and
+outfits/s through the head.
+
+    python -m benchmarks.bench_inference --weights app/siamese_model.pt --images 64 --outfits 2048
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+import numpy as np
+import torch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.siamese_network import SiameseNetwork
+from app.inference import INFERENCE_BACKENDS, create_backend
+from app.recommend_outfits import EVENT_LABELS, ENCODE_BATCH_SIZE, model_file_version
+
+
+def load_network(weights):
+    network = SiameseNetwork()
+    network.load_state_dict(torch.load(weights, map_location="cpu", weights_only=False))
+    network.eval()
+    network.version = model_file_version(weights)
+    return network
+
+
+def sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+def run_backend(backend, images, outfit_index, chunk):
+    start = time.perf_counter()
+    embeddings = np.concatenate([backend.encode(images[i:i + ENCODE_BATCH_SIZE])
+                                 for i in range(0, len(images), ENCODE_BATCH_SIZE)])
+    encode_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    probs = np.concatenate([sigmoid(backend.score_embeddings(embeddings[outfit_index[i:i + chunk]])[0])
+                            for i in range(0, len(outfit_index), chunk)])
+    score_seconds = time.perf_counter() - start
+    return embeddings, probs, encode_seconds, score_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--weights", default="app/siamese_model.pt")
+    parser.add_argument("--backends", nargs="+", default=list(INFERENCE_BACKENDS), choices=INFERENCE_BACKENDS)
+    parser.add_argument("--images", type=int, default=64)
+    parser.add_argument("--outfits", type=int, default=2048)
+    parser.add_argument("--chunk", type=int, default=512, help="outfits per head call")
+    parser.add_argument("--threads", type=int, default=0, help="onnxruntime intra-op threads, 0 = default")
+    parser.add_argument("--export-dir", default=None, help="reuse ONNX exports from here (default: temp dir)")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    images = rng.random((args.images, 3, 224, 224), dtype=np.float32)
+    outfit_index = rng.integers(0, args.images, size=(args.outfits, 7))
+
+    network = load_network(args.weights)
+    with tempfile.TemporaryDirectory() as tmp:
+        export_dir = args.export_dir or tmp
+        results = []
+        reference = None
+        for name in ["torch"] + [b for b in args.backends if b != "torch"]:
+            backend = create_backend(network, name, export_dir=export_dir, threads=args.threads)
+            run_backend(backend, images[:2], outfit_index[:2] % 2, args.chunk)  # warm-up
+            embeddings, probs, encode_seconds, score_seconds = run_backend(backend, images, outfit_index, args.chunk)
+            if reference is None:
+                reference = (embeddings, probs)
+
+            diff = np.abs(probs - reference[1])
+            cosine = np.sum(embeddings * reference[0], axis=1) / (
+                np.linalg.norm(embeddings, axis=1) * np.linalg.norm(reference[0], axis=1))
+            result = {
+                "backend": name,
+                "encode_images_per_second": round(args.images / encode_seconds, 1),
+                "score_outfits_per_second": round(args.outfits / score_seconds, 1),
+                "max_abs_score_diff": float(diff.max()),
+                "max_abs_score_diff_per_event": {e: float(d) for e, d in zip(EVENT_LABELS, diff.max(axis=0))},
+                "min_embedding_cosine": float(cosine.min()),
+                "top_event_agreement": float(np.mean(probs.argmax(axis=1) == reference[1].argmax(axis=1))),
+            }
+            results.append(result)
+            print(f"{name:>10}  encode {result['encode_images_per_second']:8.1f} img/s  "
+                  f"head {result['score_outfits_per_second']:9.1f} outfits/s  "
+                  f"max |Δscore| {result['max_abs_score_diff']:.2e}  "
+                  f"top event agreement {result['top_event_agreement']:.3f}")
+
+    if "torch" not in args.backends:
+        results = results[1:]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
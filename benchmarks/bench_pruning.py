@@ -0,0 +1,145 @@
+"""
+Recall of two-stage candidate pruning against exhaustive scoring on synthetic wardrobes.
+For every wardrobe, scorer and prune ratio it runs the same selection as
+generate_recommendations and reports, per event, how many of the exhaustive top K outfits
+the pruned search still finds (recall@K), plus the full-head work and time saved.
+
+Without --weights the network is randomly initialized, which says little about the recall
+with the trained model: pass the real weights before choosing RECOMMENDATION_PRUNE_RATIO.
+
+    python -m benchmarks.bench_pruning --weights app/siamese_model.pt \\
+        --wardrobe Tops=8,Bottoms=6,Shoes=4,Hats=3 Tops=14,Bottoms=10,Shoes=6,Hats=4,Sunglasses=3 \\
+        --ratios 0.5 0.2 0.1 --scorers head cosine
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.inference import create_backend, INFERENCE_BACKENDS
+from app.pruning import PRUNE_SCORERS, create_scorer, candidate_budget, select_candidates
+from app.recommend_outfits import (EVENT_LABELS, WardrobeItem, TopOutfits, transform, build_slot_layouts,
+                                   count_combinations, iter_combinations, iter_chunks, score_outfits,
+                                   chunk_size_for_budget, model_file_version, ENCODE_BATCH_SIZE)
+
+
+def load_network(weights, seed):
+    import torch
+    from app.siamese_network import SiameseNetwork
+
+    torch.manual_seed(seed)
+    network = SiameseNetwork(pretrained=False)
+    network.version = f"random-{seed}"
+    if weights:
+        network.load_state_dict(torch.load(weights, map_location="cpu", weights_only=False))
+        network.version = model_file_version(weights)
+    return network.eval()
+
+
+def synthetic_wardrobe(spec, rng):
+    """Category=count pairs -> WardrobeItems and (N, 3, 224, 224) inputs from smooth random images."""
+    items, tensors = [], []
+    for pair in spec.split(","):
+        category, count = pair.split("=")
+        for i in range(int(count)):
+            small = rng.integers(0, 256, size=(8, 8, 3), dtype=np.uint8)
+            image = Image.fromarray(small).resize((224, 224), Image.BICUBIC)
+            items.append(WardrobeItem(f"{category.lower()}_{i}.jpg", category))
+            tensors.append(transform(image))
+    return items, np.stack(tensors)
+
+
+def encode(backend, tensors):
+    return np.concatenate([backend.encode(tensors[i:i + ENCODE_BATCH_SIZE])
+                           for i in range(0, len(tensors), ENCODE_BATCH_SIZE)])
+
+
+def rank(backend, chunks, embeddings, blank, top_k):
+    """Full-head scoring of (seq, outfit) chunks; returns the TopOutfits and the number scored."""
+    top = TopOutfits(top_k)
+    scored = 0
+    for chunk in chunks:
+        batch = [outfit for _, outfit in chunk]
+        top.push_batch(batch, score_outfits(backend, batch, embeddings, blank), [seq for seq, _ in chunk])
+        scored += len(batch)
+    return top, scored
+
+
+def top_sets(top):
+    return [{-neg_seq for _, neg_seq, _, _ in heap} for heap in top.heaps]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--weights", help="SiameseNetwork state dict (default: random initialization)")
+    parser.add_argument("--backend", default="torch", choices=INFERENCE_BACKENDS)
+    parser.add_argument("--wardrobe", nargs="+", default=["Tops=8,Bottoms=6,Shoes=4,Hats=3",
+                                                          "Tops=12,Bottoms=8,Shoes=5,Hats=4,Sunglasses=3"])
+    parser.add_argument("--ratios", type=float, nargs="+", default=[0.5, 0.2, 0.1])
+    parser.add_argument("--scorers", nargs="+", default=list(PRUNE_SCORERS), choices=PRUNE_SCORERS)
+    parser.add_argument("--top-k", type=int, default=50)
+    parser.add_argument("--memory-budget-mb", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    network = load_network(args.weights, args.seed)
+    backend = create_backend(network, args.backend, export_dir=os.path.abspath("assets/onnx"))
+    chunk_size = chunk_size_for_budget(args.memory_budget_mb)
+    blank = backend.encode(transform(Image.new("RGB", (224, 224), (255, 255, 255)))[np.newaxis])[0]
+
+    results = []
+    for spec in args.wardrobe:
+        items, tensors = synthetic_wardrobe(spec, rng)
+        embeddings = dict(zip((item.image_path for item in items), encode(backend, tensors)))
+        layouts = build_slot_layouts(items)
+        total = count_combinations(layouts)
+
+        start = time.perf_counter()
+        exhaustive, _ = rank(backend, iter_chunks(enumerate(iter_combinations(layouts)), chunk_size),
+                             embeddings, blank, args.top_k)
+        exhaustive_seconds = time.perf_counter() - start
+        reference = top_sets(exhaustive)
+        reference_stored = set().union(*reference)
+        print(f"{spec}: {total} outfits, exhaustive {exhaustive_seconds:.2f}s")
+
+        for scorer_name in args.scorers:
+            for ratio in args.ratios:
+                budget = candidate_budget(total, ratio, args.top_k)
+                start = time.perf_counter()
+                scorer = create_scorer(scorer_name, backend, embeddings, blank)
+                candidates = select_candidates(lambda: iter_chunks(iter_combinations(layouts), chunk_size),
+                                               scorer, budget)
+                pruned, scored = rank(backend, iter_chunks(candidates, chunk_size), embeddings, blank, args.top_k)
+                pruned_seconds = time.perf_counter() - start
+
+                found = top_sets(pruned)
+                recall = [len(f & r) / len(r) for f, r in zip(found, reference)]
+                row = {
+                    "wardrobe": spec, "outfits": total, "scorer": scorer_name, "prune_ratio": ratio,
+                    "budget": budget, "head_scored": scored, "within_budget": scored <= budget,
+                    "head_scored_share": round(scored / total, 4),
+                    "recall_at_k_mean": round(float(np.mean(recall)), 4),
+                    "recall_at_k_min": round(float(np.min(recall)), 4),
+                    "recall_at_k": {event: round(r, 4) for event, r in zip(EVENT_LABELS, recall)},
+                    "stored_recall": round(len(set().union(*found) & reference_stored) / len(reference_stored), 4),
+                    "exhaustive_seconds": round(exhaustive_seconds, 3),
+                    "pruned_seconds": round(pruned_seconds, 3),
+                    "random_weights": not args.weights,
+                }
+                results.append(row)
+                print(f"  {scorer_name:<6} ratio {ratio:<5} head scored {scored:>7} ({row['head_scored_share']:.1%})  "
+                      f"recall@{args.top_k} mean {row['recall_at_k_mean']:.3f} min {row['recall_at_k_min']:.3f}  "
+                      f"{pruned_seconds:.2f}s")
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Scaling of sharded multi-process scoring against scoring in one thread, on a synthetic wardrobe.
+For every worker count it reports the wall time of the full-head pass over all outfits, the
+speedup and parallel efficiency, the one-off pool start-up (process spawn and model load) and
+whether the kept top K outfits and scores are identical to the sequential run.
+
+Each worker runs torch with --threads threads (default: cores / workers), so the rows compare
+the same total number of threads split across more processes.
+
+    python -m benchmarks.bench_scoring --wardrobe Tops=14,Bottoms=10,Shoes=8,Hats=4 --workers 1 2 4 8
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks.bench_pruning import load_network, synthetic_wardrobe, encode
+from app.inference import create_backend, INFERENCE_BACKENDS
+from app.parallel_scoring import ScoringPool
+from app.recommend_outfits import (TopOutfits, transform, build_slot_layouts, count_combinations,
+                                   iter_combinations, score_candidates, chunk_size_for_budget)
+
+
+def kept(top):
+    """Per event, the kept (score, seq) pairs in rank order: what generate_recommendations would store."""
+    return [sorted(((score, -neg_seq) for score, neg_seq, _, _ in heap), key=lambda e: (-e[0], e[1]))
+            for heap in top.heaps]
+
+
+def run(backend, layouts, embeddings, blank, top_k, chunk_size, total, pool=None, weights_path=None):
+    top = TopOutfits(top_k)
+    start = time.perf_counter()
+    scored = score_candidates(backend, enumerate(iter_combinations(layouts)), embeddings, blank, top, chunk_size,
+                              total, pool=pool, weights_path=weights_path)
+    return top, scored, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--weights", help="SiameseNetwork state dict (default: random initialization)")
+    parser.add_argument("--backend", default="torch", choices=INFERENCE_BACKENDS)
+    parser.add_argument("--wardrobe", default="Tops=12,Bottoms=10,Shoes=8,Hats=4")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--threads", type=int, default=0, help="torch threads per worker, 0 = cores / workers")
+    parser.add_argument("--top-k", type=int, default=50)
+    parser.add_argument("--memory-budget-mb", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    import torch
+
+    rng = np.random.default_rng(args.seed)
+    network = load_network(args.weights, args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        weights_path = args.weights
+        if not weights_path:
+            # Workers load their copy from a checkpoint
+            weights_path = os.path.join(tmp, "random_weights.pt")
+            torch.save(network.state_dict(), weights_path)
+        export_dir = os.path.abspath("assets/onnx")
+        backend = create_backend(network, args.backend, export_dir=export_dir)
+        blank = backend.encode(transform(Image.new("RGB", (224, 224), (255, 255, 255)))[np.newaxis])[0]
+
+        items, tensors = synthetic_wardrobe(args.wardrobe, rng)
+        embeddings = dict(zip((item.image_path for item in items), encode(backend, tensors)))
+        layouts = build_slot_layouts(items)
+        total = count_combinations(layouts)
+        chunk_size = chunk_size_for_budget(args.memory_budget_mb)
+
+        reference, _, sequential_seconds = run(backend, layouts, embeddings, blank, args.top_k, chunk_size, total)
+        reference_kept = kept(reference)
+        print(f"{args.wardrobe}: {total} outfits, sequential {sequential_seconds:.2f}s "
+              f"with {torch.get_num_threads()} torch threads")
+
+        results = []
+        for workers in args.workers:
+            pool = ScoringPool()
+            pool.workers = workers
+            pool.threads = args.threads or ScoringPool.default_threads(workers)
+            pool.export_dir = export_dir
+
+            # Start the processes and load the model outside the timed run
+            start = time.perf_counter()
+            warm_layouts = [[slot[:1] for slot in layouts[0]]]
+            run(backend, warm_layouts, embeddings, blank, args.top_k, chunk_size, 1, pool, weights_path)
+            startup_seconds = time.perf_counter() - start
+
+            top, scored, seconds = run(backend, layouts, embeddings, blank, args.top_k, chunk_size, total,
+                                       pool, weights_path)
+            pool._executor.shutdown()
+            row = {
+                "wardrobe": args.wardrobe, "outfits": total, "scored": scored,
+                "workers": workers, "threads_per_worker": pool.threads, "cpu_count": os.cpu_count(),
+                "seconds": round(seconds, 3),
+                "outfits_per_second": round(total / seconds, 1),
+                "speedup": round(sequential_seconds / seconds, 3),
+                "efficiency": round(sequential_seconds / seconds / workers, 3),
+                "startup_seconds": round(startup_seconds, 3),
+                "sequential_seconds": round(sequential_seconds, 3),
+                "identical_to_sequential": kept(top) == reference_kept,
+                "random_weights": not args.weights,
+            }
+            results.append(row)
+            print(f"  {workers} workers x {pool.threads} threads: {seconds:.2f}s, speedup {row['speedup']:.2f}, "
+                  f"efficiency {row['efficiency']:.2f}, identical {row['identical_to_sequential']}")
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+"""
+End-to-end benchmark suite on a synthetic wardrobe, fully offline: random JPEGs, a randomly
+initialized SiameseNetwork and BACKGROUND_REMOVAL=none (no Drive or rembg downloads). Times
+- /upload-multiple (request) and the upload pipeline until every image is ready
+- generate_recommendations end to end and per stage, with cold caches, warm caches and as
+  an incremental run after one more upload
+- /recommend, /save_outfits and /fp_growth_saved through the Flask test client
+and writes one JSON document, so runs on different commits can be compared.
+
+    python -m benchmarks.bench_suite --wardrobe Tops=8 Bottoms=6 Shoes=4 Hats=3 --output bench.json
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import tempfile
+import subprocess
+
+import numpy as np
+from PIL import Image
+
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, REPO_DIR)
+
+# generate_recommendations looks these up as module globals, so wrapping them times each stage
+STAGES = ["build_slot_layouts", "preprocess_images", "get_embeddings", "score_outfits",
+          "delete_results", "bulk_insert_results"]
+
+
+class StageTimer:
+    def __init__(self, module):
+        self.totals = {}
+        for name in STAGES:
+            setattr(module, name, self._wrap(name, getattr(module, name)))
+        top_outfits = module.TopOutfits
+        top_outfits.push_batch = self._wrap("top_k_heaps", top_outfits.push_batch)
+
+    def _wrap(self, name, fn):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                calls, seconds = self.totals.get(name, (0, 0.0))
+                self.totals[name] = (calls + 1, seconds + time.perf_counter() - start)
+        return timed
+
+    def reset(self):
+        self.totals = {}
+
+    def report(self):
+        stages = {name: {"calls": calls, "seconds": round(seconds, 4)} for name, (calls, seconds) in self.totals.items()}
+        if "get_embeddings" in stages:
+            # get_embeddings includes preprocessing; what is left is the encoder
+            encode = stages["get_embeddings"]["seconds"] - stages.get("preprocess_images", {}).get("seconds", 0.0)
+            stages["encode"] = {"calls": stages["get_embeddings"]["calls"], "seconds": round(encode, 4)}
+        return stages
+
+
+def latency_stats(seconds):
+    ms = np.array(seconds) * 1000
+    return {"count": len(ms), "mean_ms": round(float(ms.mean()), 3), "p50_ms": round(float(np.percentile(ms, 50)), 3),
+            "p95_ms": round(float(np.percentile(ms, 95)), 3), "max_ms": round(float(ms.max()), 3)}
+
+
+def random_jpeg(rng, width, height):
+    # Smooth colour blobs plus a little noise, so JPEG sizes look like photos rather than static
+    small = rng.integers(0, 256, size=(height // 32 + 1, width // 32 + 1, 3), dtype=np.uint8)
+    img = Image.fromarray(small).resize((width, height), Image.BICUBIC)
+    noisy = np.asarray(img, dtype=np.int16) + rng.integers(-8, 9, size=(height, width, 3))
+    buffer = io.BytesIO()
+    Image.fromarray(np.clip(noisy, 0, 255).astype(np.uint8)).save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def configure_environment(tmp, args):
+    """Points every path of the app at tmp; must run before app.main is imported."""
+    import torch
+    from app.siamese_network import SiameseNetwork
+
+    torch.manual_seed(args.seed)
+    model_path = os.path.join(tmp, "siamese_model.pt")
+    torch.save(SiameseNetwork(pretrained=False).state_dict(), model_path)
+
+    os.environ.update(
+        DATABASE_PATH=os.path.join(tmp, "assets", "database.db"),
+        UPLOAD_FOLDER=os.path.join(tmp, "uploads"),
+        EMBEDDING_CACHE_DIR=os.path.join(tmp, "assets", "embeddings"),
+        TENSOR_STORE_DIR=os.path.join(tmp, "assets", "tensors"),
+        ONNX_EXPORT_DIR=os.path.join(tmp, "assets", "onnx"),
+        MODEL_PATH=model_path,
+        MODEL_WARMUP="lazy",
+        INFERENCE_BACKEND=args.backend,
+        RECOMMENDATION_WORKERS="0",  # the suite runs generate_recommendations itself
+        BACKGROUND_REMOVAL="none",
+        BACKGROUND_REMOVAL_WORKERS=str(args.upload_workers),
+    )
+    os.chdir(tmp)  # relative paths used by routes (e.g. static/) stay inside the temp dir
+
+
+def upload(client, rng, user_id, category, count, size):
+    files = [(io.BytesIO(random_jpeg(rng, *size)), f"{category.lower()}_{i}.jpg") for i in range(count)]
+    start = time.perf_counter()
+    response = client.post("/upload-multiple", data={"user_id": str(user_id), "category": category, "images": files},
+                           content_type="multipart/form-data")
+    elapsed = time.perf_counter() - start
+    assert response.status_code == 202, response.get_json()
+    return [img["image_id"] for img in response.get_json()["images"]], elapsed
+
+
+def wait_until_ready(client, image_ids, timeout=600):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        statuses = client.get(f"/upload-status?image_ids={','.join(image_ids)}").get_json()["images"]
+        if all(s["status"] != "processing" for s in statuses):
+            failed = [s for s in statuses if s["status"] != "ready"]
+            assert not failed, failed
+            return
+        time.sleep(0.05)
+    raise TimeoutError("uploads did not finish processing")
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--wardrobe", nargs="+", default=["Tops=8", "Bottoms=6", "Shoes=4", "Hats=3"],
+                        help="Category=count pairs (categories as the client sends them)")
+    parser.add_argument("--image-size", default="600x800", help="WIDTHxHEIGHT of the generated uploads")
+    parser.add_argument("--backend", default="torch")
+    parser.add_argument("--upload-workers", type=int, default=1)
+    parser.add_argument("--requests", type=int, default=20, help="repetitions per timed endpoint")
+    parser.add_argument("--saved", type=int, default=30, help="outfits saved before timing /fp_growth_saved")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON here instead of stdout")
+    args = parser.parse_args()
+
+    wardrobe = {}
+    for pair in args.wardrobe:
+        category, count = pair.split("=")
+        wardrobe[category] = int(count)
+    size = tuple(int(v) for v in args.image_size.split("x"))
+    rng = np.random.default_rng(args.seed)
+    random.seed(args.seed)
+    output = os.path.abspath(args.output) if args.output else None
+
+    with tempfile.TemporaryDirectory() as tmp:
+        configure_environment(tmp, args)
+
+        import torch
+        import app.recommend_outfits as recommend_outfits
+        from app.main import app, bg_pipeline
+
+        stages = StageTimer(recommend_outfits)
+        client = app.test_client()
+        results = {
+            "meta": {
+                "commit": git_commit(), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "python": platform.python_version(), "torch": torch.__version__,
+                "torch_threads": torch.get_num_threads(), "cpu_count": os.cpu_count(),
+                "wardrobe": wardrobe, "image_size": list(size), "backend": args.backend, "seed": args.seed,
+            }
+        }
+
+        # Uploads
+        client.post("/register", json={"username": "bench", "password": "bench"})
+        user_id = client.post("/login", json={"username": "bench", "password": "bench"}).get_json()["user_id"]
+        request_seconds, image_ids = [], []
+        pipeline_start = time.perf_counter()
+        for category, count in wardrobe.items():
+            ids, elapsed = upload(client, rng, user_id, category, count, size)
+            image_ids += ids
+            request_seconds.append(elapsed)
+        wait_until_ready(client, image_ids)
+        results["upload"] = {
+            "images": len(image_ids),
+            "request": latency_stats(request_seconds),
+            "pipeline_seconds": round(time.perf_counter() - pipeline_start, 4),
+        }
+
+        # generate_recommendations
+        with app.app_context():
+            start = time.perf_counter()
+            recommend_outfits.get_model()
+            results["model_load_seconds"] = round(time.perf_counter() - start, 4)
+
+            def run(label, **kwargs):
+                stages.reset()
+                start = time.perf_counter()
+                recommend_outfits.generate_recommendations(user_id, **kwargs)
+                elapsed = time.perf_counter() - start
+                results["generate"][label] = {
+                    "seconds": round(elapsed, 4),
+                    "stored_rows": recommend_outfits.RecommendationResult.query.filter_by(user_id=user_id).count(),
+                    "stages": stages.report(),
+                }
+
+            results["generate"] = {}
+            images = recommend_outfits.ImageModel.query.filter_by(user_id=user_id, status="ready").all()
+            results["generate"]["outfits"] = recommend_outfits.count_combinations(
+                recommend_outfits.build_slot_layouts(images))
+            run("cold")
+            run("warm")
+
+        extra_ids, _ = upload(client, rng, user_id, next(iter(wardrobe)), 1, size)
+        wait_until_ready(client, extra_ids)
+        with app.app_context():
+            new_path = recommend_outfits.db.session.get(recommend_outfits.ImageModel, extra_ids[0]).image_path
+            run("incremental", new_image_paths=[new_path])
+
+        # /recommend
+        recommend_seconds, outfits = [], []
+        for i in range(args.requests):
+            event = recommend_outfits.EVENT_LABELS[i % len(recommend_outfits.EVENT_LABELS)]
+            start = time.perf_counter()
+            response = client.post("/recommend", json={"user_id": user_id, "event": event, "threshold": 0})
+            recommend_seconds.append(time.perf_counter() - start)
+            if response.status_code == 200:
+                outfits += [(event, o["raw_filenames"]) for o in response.get_json()["results"]]
+        results["recommend"] = latency_stats(recommend_seconds)
+
+        # /save_outfits and /fp_growth_saved
+        picked = random.sample(outfits, min(args.saved, len(outfits)))
+        start = time.perf_counter()
+        response = client.post("/save_outfits", json={
+            "user_id": str(user_id),
+            "outfits": [{"event": event, "outfit": [f"/uploads/{f}" for f in filenames]} for event, filenames in picked],
+        })
+        results["save_outfits"] = {"outfits": len(picked), "seconds": round(time.perf_counter() - start, 4),
+                                   "status": response.status_code}
+
+        fp_seconds = []
+        for _ in range(args.requests + 1):
+            start = time.perf_counter()
+            client.get(f"/fp_growth_saved?user_id={user_id}&min_support=0.05")
+            fp_seconds.append(time.perf_counter() - start)
+        results["fp_growth_saved"] = {"first_ms": round(fp_seconds[0] * 1000, 3), "repeat": latency_stats(fp_seconds[1:])}
+
+        if bg_pipeline._executor is not None:
+            bg_pipeline._executor.shutdown()
+        os.chdir(REPO_DIR)
+
+    document = json.dumps(results, indent=2)
+    if output:
+        with open(output, "w") as f:
+            f.write(document + "\n")
+        print(f"📊 Wrote {output}")
+    else:
+        print(document)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Starts gunicorn with and without preload_app and reports per-process memory from
+/proc/<pid>/smaps_rollup once every worker has warmed up the model. PSS (proportional set
+size) splits shared pages between the processes that map them, so the PSS total is what the
+server really costs; RSS counts shared pages once per process. Linux only.
+
+    python -m benchmarks.bench_worker_memory --weights app/siamese_model.pt --workers 2 4
+"""
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import tempfile
+import subprocess
+import urllib.request
+import urllib.error
+
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+FIELDS = ["Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty"]
+
+
+def read_memory(pid):
+    """smaps_rollup fields in MiB."""
+    memory = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if parts[0].rstrip(":") in FIELDS:
+                memory[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return memory
+
+
+def children(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(p) for p in f.read().split()]
+    except FileNotFoundError:
+        return []
+
+
+def ready(port):
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/ready", timeout=5) as response:
+            return response.status == 200
+    except (urllib.error.URLError, ConnectionError, TimeoutError):
+        return False
+
+
+def measure(weights, workers, preload, port, timeout):
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ,
+                   DATABASE_PATH=os.path.join(tmp, "database.db"),
+                   UPLOAD_FOLDER=os.path.join(tmp, "uploads"),
+                   EMBEDDING_CACHE_DIR=os.path.join(tmp, "embeddings"),
+                   TENSOR_STORE_DIR=os.path.join(tmp, "tensors"),
+                   MODEL_PATH=weights,
+                   MODEL_WARMUP="background",
+                   WEB_CONCURRENCY=str(workers),
+                   GUNICORN_BIND=f"127.0.0.1:{port}",
+                   GUNICORN_PRELOAD="1" if preload else "0")
+        master = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app.main:app"],
+                                  cwd=REPO_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            # Ready once /ready answers and every worker's RSS has stopped growing (all warmed up)
+            deadline = time.monotonic() + timeout
+            previous, stable = None, 0
+            while time.monotonic() < deadline and stable < 3:
+                time.sleep(1)
+                pids = children(master.pid)
+                if len(pids) != workers or not ready(port):
+                    continue
+                current = [read_memory(pid)["Rss"] for pid in pids]
+                if previous is not None and len(previous) == len(current) and \
+                        all(abs(a - b) < 1 for a, b in zip(previous, current)):
+                    stable += 1
+                else:
+                    stable = 0
+                previous = current
+            if stable < 3:
+                raise RuntimeError(f"Server did not settle within {timeout}s")
+
+            processes = {"master": read_memory(master.pid)}
+            for i, pid in enumerate(sorted(children(master.pid))):
+                processes[f"worker-{i}"] = read_memory(pid)
+        finally:
+            master.send_signal(signal.SIGTERM)
+            master.wait(timeout=60)
+
+    worker_stats = [m for name, m in processes.items() if name != "master"]
+    return {
+        "preload": preload,
+        "workers": workers,
+        "processes": {name: {k: round(v, 1) for k, v in m.items()} for name, m in processes.items()},
+        "mean_worker_rss_mib": round(sum(m["Rss"] for m in worker_stats) / workers, 1),
+        "mean_worker_pss_mib": round(sum(m["Pss"] for m in worker_stats) / workers, 1),
+        "mean_worker_private_mib": round(sum(m["Private_Clean"] + m["Private_Dirty"] for m in worker_stats) / workers, 1),
+        "total_pss_mib": round(sum(m["Pss"] for m in processes.values()), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--weights", default=os.path.join(REPO_DIR, "app", "siamese_model.pt"))
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4])
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--timeout", type=float, default=600)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.weights):
+        sys.exit(f"Model weights not found at {args.weights}")
+
+    results = []
+    for workers in args.workers:
+        for preload in (False, True):
+            result = measure(os.path.abspath(args.weights), workers, preload, args.port, args.timeout)
+            results.append(result)
+            print(f"{workers} workers, preload {'on ' if preload else 'off'}: per worker RSS "
+                  f"{result['mean_worker_rss_mib']:7.1f} MiB  PSS {result['mean_worker_pss_mib']:7.1f} MiB  "
+                  f"private {result['mean_worker_private_mib']:7.1f} MiB  total PSS {result['total_pss_mib']:7.1f} MiB")
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
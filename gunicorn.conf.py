@@ -0,0 +1,47 @@
+# gunicorn -c gunicorn.conf.py app.main:app
+#
+# With preload_app (default) the master imports app.main once and loads the Siamese weights
+# before forking, so every worker maps the same physical pages copy-on-write instead of
+# holding its own copy. Threads and database connections do not survive a fork, so each
+# worker starts its own in post_fork; that includes the inference backend (ONNX export and
+# onnxruntime sessions), which the workers build around the shared network. GUNICORN_PRELOAD=0 gives the old behaviour (every
+# worker imports the app and loads the model itself).
+import gc
+import os
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8080")
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+threads = int(os.environ.get("GUNICORN_THREADS", 1))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") == "1"
+
+if preload_app:
+    os.environ["PRELOAD_MODEL"] = "1"  # read by app.main while the master imports it
+
+
+def when_ready(server):
+    if preload_app:
+        # Move everything the master allocated into the permanent generation, so the
+        # workers' garbage collections do not write to (and un-share) those pages
+        gc.freeze()
+        server.log.info("Froze %d objects before forking workers", gc.get_freeze_count())
+
+
+def post_fork(server, worker):
+    if not preload_app:
+        return
+    from app.main import app, start_background_services
+    from app.database import db
+    from app.background_removal import pipeline
+    from app.parallel_scoring import scoring_pool
+
+    with app.app_context():
+        db.engine.dispose(close=False)  # the master's pooled connections belong to the master
+
+    # BACKGROUND_REMOVAL_WORKERS is the server-wide number of rembg processes: each of them
+    # holds its own copy of the rembg model, so split them across the web workers
+    pipeline.workers = max(1, app.config["BACKGROUND_REMOVAL_WORKERS"] // server.cfg.workers)
+    # Same for the scoring processes; their torch threads were already sized for the server-wide count
+    if scoring_pool.workers:
+        scoring_pool.workers = max(1, app.config["RECOMMENDATION_SCORING_WORKERS"] // server.cfg.workers)
+    start_background_services()
@@ -0,0 +1,59 @@
+import json
+
+from flask import Flask
+
+import app.jobs as jobs
+from app.database import db, User, ImageModel, RecommendationJob
+
+
+def make_app(tmp_path):
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{tmp_path / 'database.db'}"
+    app.config["RECOMMENDATION_WORKERS"] = 0
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(id=1, username="u", password="x"))
+        db.session.add_all([ImageModel(id=image_id, image_path=f"{image_id}.jpg", category="Tops", user_id=1)
+                            for image_id in ("TOP01", "TOP02")])
+        db.session.commit()
+    return app
+
+
+def run_pending_job(app, monkeypatch):
+    calls = {}
+    monkeypatch.setattr(jobs, "cache_embeddings", lambda user_id, paths: calls.setdefault("cached", paths))
+    monkeypatch.setattr(jobs, "generate_recommendations",
+                        lambda user_id, new_image_paths=None, progress=None: calls.setdefault("scored", new_image_paths))
+    scheduler = jobs.RecommendationScheduler(app)
+    job_id = scheduler._claim()
+    scheduler._run(job_id)
+    return db.session.get(RecommendationJob, job_id), calls
+
+
+def test_image_deleted_while_incremental_job_pending(tmp_path, monkeypatch):
+    # The deleted image's file is gone: the job must still score the image that survived
+    app = make_app(tmp_path)
+    with app.app_context():
+        scheduler = jobs.RecommendationScheduler(app)
+        scheduler.enqueue(1, ["TOP01.jpg"])
+        scheduler.enqueue(1, ["TOP02.jpg"])
+        db.session.delete(db.session.get(ImageModel, "TOP01"))
+        db.session.commit()
+
+        job, calls = run_pending_job(app, monkeypatch)
+        assert job.status == "done"
+        assert json.loads(job.new_image_paths) == ["TOP01.jpg", "TOP02.jpg"]
+        assert calls == {"cached": ["TOP02.jpg"], "scored": ["TOP02.jpg"]}
+
+
+def test_job_with_only_deleted_images_does_nothing(tmp_path, monkeypatch):
+    app = make_app(tmp_path)
+    with app.app_context():
+        jobs.RecommendationScheduler(app).enqueue(1, ["TOP01.jpg"])
+        db.session.delete(db.session.get(ImageModel, "TOP01"))
+        db.session.commit()
+
+        job, calls = run_pending_job(app, monkeypatch)
+        assert job.status == "done"
+        assert calls == {}
@@ -0,0 +1,18 @@
+import torch
+
+from app.siamese_network import SiameseNetwork
+
+
+def test_batched_scores_match_single_outfits():
+    # score_embeddings keeps global attention inside each outfit, so a batch must give
+    # every outfit the score forward_head gives it alone (B=1)
+    torch.manual_seed(0)
+    network = SiameseNetwork(pretrained=False).eval()
+    embeddings = torch.randn(5, 7, 2048)
+
+    with torch.no_grad():
+        logits, attention = network.score_embeddings(embeddings)
+        for i in range(len(embeddings)):
+            single_logits, single_attention = network.forward_head(embeddings[i:i + 1])
+            assert torch.allclose(logits[i:i + 1], single_logits, atol=1e-5)
+            assert torch.allclose(attention[i:i + 1], single_attention, atol=1e-5)